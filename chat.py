@@ -11,6 +11,8 @@ from io import BytesIO
 from datetime import datetime
 from supabase import create_client
 from openai import OpenAI
+from query_compiler import compile_filters, apply_filters, describe
+import session_store
 
 client = OpenAI()
 
@@ -29,24 +31,11 @@ def log_message(message):
 
 
 def get_chat_history(user_id, session_id):
-    filename = f"chat_{user_id}_{session_id}.json"
-    try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-
-def save_chat_history(user_id, session_id, messages):
-    filename = f"chat_{user_id}_{session_id}.json"
-    with open(filename, "w") as f:
-        json.dump(messages, f, indent=2)
+    return session_store.get_messages(user_id, session_id)
 
 
 def store_message(user_id, session_id, message):
-    messages = get_chat_history(user_id, session_id)
-    messages.append(message)
-    save_chat_history(user_id, session_id, messages)
+    session_store.append_message(user_id, session_id, message)
 
 
 def call_agent(chat_history, tools):
@@ -99,56 +88,13 @@ def summarize_pdf(input):
         return {"error": str(e)}
 
 
-def generate_query_with_llm(input):
-    system_prompt = """You are an assistant that generates Supabase queries in Python.
-    You must only generate queries that read data.
-    Do not generate any other types of queries like INSERT, UPDATE, or DELETE.
-    - Example:
-      Input: {"gr_no": "1234", "date": "2024-01", "branch": "Finance"}
-      Output:
-      query = supabase.table("documents").select("*").ilike("gr_no", "%1234%").gte("date", "2024-01-01").lt("date", "2024-02-01").ilike("branch", "%Finance%")
-    - If filtering by "date", always use `gte("date", "YYYY-MM-DD")` and `lt("date", "YYYY-MM-DD")` for the end of the month.
-    - If filtering by "gr_no", "branch", "subject_en" and "subject_gu", always use `ilike("gr_no", "%search_term%")`, `ilike("branch", "%search_term")`, `ilike("subject_en", "%search_term%")` and `ilike("subject_gu", "%search_term%")`.
-    Return only the Python code for the SELECT query (no explanations).
-    """
-
-    user_prompt = f"Generate a Supabase query for this input: {input}"
-
-    response = (
-        client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0,
-        )
-        .choices[0]
-        .message.content
-    )
-
-    if (
-        not response.strip().lower().startswith("query = supabase.table")
-        or "select" not in response.lower()
-    ):
-        raise ValueError(
-            "Only SELECT queries are allowed. Query generated is not a SELECT query."
-        )
-
-    return response
-
-
 def get_pdf_related_data(input):
     try:
-        log_message("Generating the query...")
-        query_code = generate_query_with_llm(input)
-        print(f"  {query_code}")
-
-        if "select(" not in query_code:
-            return {"error": "Only SELECT queries are allowed"}
+        plan = compile_filters(input)
+        print(f"  {describe(plan)}")
 
         log_message("Fetching data...")
-        exec(query_code, globals())
+        query = apply_filters(supabase.table("documents").select("*"), plan)
         response = query.execute()
 
         if response and hasattr(response, "data"):
@@ -206,7 +152,7 @@ def run_agent(user_id, session_id, user_message):
                         },
                         "date": {
                             "type": "string",
-                            "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019. For a range, use 'from_date' and 'to_date' instead.",
+                            "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019, financial year 2016-17. For a range, use 'from_date' and 'to_date' instead.",
                         },
                         "from_date": {
                             "type": "string",
@@ -271,7 +217,6 @@ def run_agent(user_id, session_id, user_message):
         },
     ]
 
-    messages = get_chat_history(user_id, session_id)
     store_message(user_id, session_id, user_message)
 
     while True:
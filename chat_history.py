@@ -1,53 +1,137 @@
+import os
+import time
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
 
-cred = credentials.Certificate("credentials.json")
-firebase_admin.initialize_app(cred)
+HISTORY_PAGE_SIZE = 50
+# Firestore rejects batches of more than 500 writes
+BATCH_LIMIT = 500
 
-firestore = firestore.client()
+_db = None
+# Sessions whose legacy messages array has been checked in this process
+_imported = set()
 
-now = datetime.now()
 
+def get_db():
+    global _db
+    if _db is None:
+        if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            # The emulator accepts anonymous clients, no service account needed
+            from google.cloud import firestore as cloud_firestore
 
-def store_chat_message(user_id, session_id, message):
-    doc_ref = firestore.collection("chat_history").document(f"{user_id}_{session_id}")
+            _db = cloud_firestore.Client(
+                project=os.environ.get("FIRESTORE_PROJECT_ID", "finbot")
+            )
+        else:
+            import firebase_admin
+            from firebase_admin import credentials
+            from firebase_admin import firestore
 
-    doc = doc_ref.get()
-    messages = doc.to_dict().get("messages", []) if doc.exists else []
+            cred = credentials.Certificate("credentials.json")
+            firebase_admin.initialize_app(cred)
+            _db = firestore.client()
+    return _db
 
-    messages.append(
-        {
-            "timestamp": now.strftime("%H:%M:%S %d-%m-%Y"),
-            "role": message["role"],
-            "content": message["content"],
-        }
-    )
 
-    doc_ref.set({"messages": messages}, merge=True)
+def set_db(db):
+    global _db
+    _db = db
+    _imported.clear()
 
 
-def store_tool_call(user_id, session_id, tool_response, tool_call_id):
-    doc_ref = firestore.collection("chat_history").document(f"{user_id}_{session_id}")
-
-    doc = doc_ref.get()
-    tool_calls = doc.to_dict().get("messages", []) if doc.exists else []
-
-    tool_calls.append(
-        {
-            "timestamp": now.strftime("%H:%M:%S %d-%m-%Y"),
-            "role": "tool",
-            "content": tool_response,
-            "tool_call_id": tool_call_id,
-        }
+def _session_ref(user_id, session_id):
+    return get_db().collection("chat_history").document(f"{user_id}_{session_id}")
+
+
+def _messages_ref(user_id, session_id):
+    return _session_ref(user_id, session_id).collection("messages")
+
+
+def _message_doc(message, created_at):
+    doc = {
+        "created_at": created_at,
+        "timestamp": datetime.now().strftime("%H:%M:%S %d-%m-%Y"),
+        "role": message["role"],
+        "content": message["content"],
+    }
+    if message.get("tool_call_id"):
+        doc["tool_call_id"] = message["tool_call_id"]
+    return doc
+
+
+def store_chat_message(user_id, session_id, message):
+    _messages_ref(user_id, session_id).document().set(
+        _message_doc(message, time.time_ns())
     )
 
-    doc_ref.set({"tool_calls": tool_calls}, merge=True)
 
+def store_tool_call(user_id, session_id, tool_response, tool_call_id):
+    store_chat_message(
+        user_id,
+        session_id,
+        {"role": "tool", "content": tool_response, "tool_call_id": tool_call_id},
+    )
 
-def get_chat_history(user_id, session_id):
-    doc_ref = firestore.collection("chat_history").document(f"{user_id}_{session_id}")
-    doc = doc_ref.get()
 
-    return doc.to_dict().get("messages", []) if doc.exists else []
+def store_chat_messages(user_id, session_id, messages):
+    messages_ref = _messages_ref(user_id, session_id)
+    batch = get_db().batch()
+    created_at = time.time_ns()
+    for offset, message in enumerate(messages):
+        # Offsets keep messages of one turn in order even within the same ns
+        batch.set(messages_ref.document(), _message_doc(message, created_at + offset))
+    batch.commit()
+
+
+def import_legacy_messages(user_id, session_id):
+    # Sessions written before the subcollection kept their messages in a
+    # "messages" array on the session document. Copy them in once with
+    # created_at set to their position, so they sort ahead of anything
+    # appended since. Fixed document ids make a repeated import harmless
+    session_ref = _session_ref(user_id, session_id)
+    snapshot = session_ref.get()
+    session = (snapshot.to_dict() or {}) if snapshot.exists else {}
+    legacy = session.get("messages") or []
+    if not legacy or session.get("legacy_imported"):
+        return 0
+
+    messages_ref = session_ref.collection("messages")
+    for start in range(0, len(legacy), BATCH_LIMIT - 1):
+        batch = get_db().batch()
+        for n, message in enumerate(legacy[start : start + BATCH_LIMIT - 1], start):
+            doc = {
+                "created_at": n,
+                "timestamp": message.get("timestamp"),
+                "role": message["role"],
+                "content": message["content"],
+            }
+            if message.get("tool_call_id"):
+                doc["tool_call_id"] = message["tool_call_id"]
+            batch.set(messages_ref.document(f"legacy-{n:06d}"), doc)
+        if start + BATCH_LIMIT - 1 >= len(legacy):
+            batch.set(session_ref, {"legacy_imported": True}, merge=True)
+        batch.commit()
+    return len(legacy)
+
+
+def get_chat_history_page(
+    user_id, session_id, page_size=HISTORY_PAGE_SIZE, start_after=None
+):
+    if (user_id, session_id) not in _imported:
+        import_legacy_messages(user_id, session_id)
+        _imported.add((user_id, session_id))
+
+    query = _messages_ref(user_id, session_id).order_by("created_at")
+    if start_after is not None:
+        query = query.start_after({"created_at": start_after})
+
+    messages = [doc.to_dict() for doc in query.limit(page_size).stream()]
+    cursor = messages[-1]["created_at"] if len(messages) == page_size else None
+    return messages, cursor
+
+
+def get_chat_history(user_id, session_id, page_size=HISTORY_PAGE_SIZE):
+    messages, cursor = get_chat_history_page(user_id, session_id, page_size)
+    while cursor is not None:
+        page, cursor = get_chat_history_page(user_id, session_id, page_size, cursor)
+        messages.extend(page)
+    return messages
@@ -4,20 +4,34 @@ load_dotenv()
 
 import os
 import json
-import httpx
+import time
 import streamlit as st
-import tiktoken
 from datetime import datetime
-import pytesseract
-from pdf2image import convert_from_bytes
 from supabase import create_client
 from openai import OpenAI
+from query_compiler import compile_filters, apply_filters, describe
+import session_store
+from ocr import iter_pages
+import summary_store
+import corpus_stats
+import vector_store
+import downloader
+import hybrid_search
+import embedding_cache
+from tokens import count_tokens
+from context_window import fit_history
+from summarizer import summarize, SUMMARY_MODEL, PROMPT_VERSION
 
 client = OpenAI()
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 supabase = create_client(url, key)
 
+QUERY_PDF_TOP_K = 8
+DOCUMENT_COLUMNS = "id, gr_no, date, branch, subject_en, pdf_url"
+DOCUMENTS_PAGE_SIZE = 20
+DOCUMENTS_MAX_PAGE_SIZE = 50
+
 if "log_history" not in st.session_state:
     st.session_state.log_history = []
 
@@ -30,24 +44,24 @@ def log_message(message):
 
 
 def get_chat_history(user_id, session_id):
-    filename = f"chat_{user_id}_{session_id}.json"
-    try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-
-def save_chat_history(user_id, session_id, messages):
-    filename = f"chat_{user_id}_{session_id}.json"
-    with open(filename, "w") as f:
-        json.dump(messages, f, indent=2)
+    return session_store.get_messages(user_id, session_id)
 
 
 def store_message(user_id, session_id, message):
-    messages = get_chat_history(user_id, session_id)
-    messages.append(message)
-    save_chat_history(user_id, session_id, messages)
+    session_store.append_message(user_id, session_id, message)
+
+
+def log_page_timings(pages):
+    counts = {"text": 0, "ocr": 0, "cached": 0}
+    seconds = 0.0
+    for page in pages:
+        counts["cached" if page["cached"] else page["source"]] += 1
+        seconds += page["seconds"]
+        yield page
+    log_message(
+        f"Read {counts['text']} pages from the text layer, OCRed {counts['ocr']} "
+        f"({seconds:.1f}s) and reused {counts['cached']} from the cache."
+    )
 
 
 def call_agent(chat_history, tools):
@@ -67,7 +81,7 @@ def call_agent(chat_history, tools):
 def summary_llm(text, prompt):
     response = (
         client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=SUMMARY_MODEL,
             messages=[
                 {"role": "system", "content": prompt},
                 {"role": "user", "content": text},
@@ -82,47 +96,39 @@ def summary_llm(text, prompt):
 def summarize_pdf(input):
     try:
         log_message("Inside summarize_pdf")
-        log_message("Fetching the PDF...")
-        with httpx.Client() as client:
-            response = client.get(input["pdf_url"])
-            response.raise_for_status()
-
-        pdf_binary = response.content
+        stored = summary_store.get_summary(
+            SUMMARY_MODEL, PROMPT_VERSION, pdf_url=input["pdf_url"]
+        )
+        if stored is not None:
+            log_message("Found a stored summary.")
+            return {"summary": stored}
 
-        images = convert_from_bytes(pdf_binary)
+        log_message("Fetching the PDF...")
+        blob = downloader.download(input["pdf_url"])
+        with open(blob["path"], "rb") as f:
+            pdf_binary = f.read()
+        content_hash = blob["sha256"]
 
         log_message("Fetching successful.")
 
-        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
-        text = ""
-        summaries = []
-        max_tokens = 100000
-
-        log_message("Extracting the text...")
-        for img in images:
-            page_text = pytesseract.image_to_string(img, lang="eng+guj")
-            if len(encoding.encode(text + page_text + "\n")) < max_tokens:
-                text += page_text + "\n"
-            else:
-                summaries.append(
-                    summary_llm(
-                        text,
-                        "Summarize the given content with all the important details.",
-                    )
-                )
-                text = page_text + "\n"
-
-        log_message("Summarizing the text...")
-        if summaries:
-            combined_summaries = "\n\n\n".join(summaries)
-            final_summary = summary_llm(
-                combined_summaries,
-                "Given the summaries separated by three newlines, generate a final summary.",
-            )
-        else:
-            final_summary = summary_llm(
-                text, "Summarize the given content with all the important details."
+        stored = summary_store.get_summary(
+            SUMMARY_MODEL, PROMPT_VERSION, content_hash=content_hash
+        )
+        if stored is not None:
+            log_message("Found a stored summary for the same PDF.")
+            summary_store.put_summary(
+                content_hash, SUMMARY_MODEL, PROMPT_VERSION, stored, input["pdf_url"]
             )
+            return {"summary": stored}
+
+        log_message("Extracting the text and summarizing...")
+        pages = log_page_timings(iter_pages(pdf_binary))
+        final_summary = summarize(
+            (page["text"] for page in pages), summary_llm, log=log_message
+        )
+        summary_store.put_summary(
+            content_hash, SUMMARY_MODEL, PROMPT_VERSION, final_summary, input["pdf_url"]
+        )
 
         return {"summary": final_summary}
 
@@ -133,23 +139,52 @@ def summarize_pdf(input):
 def query_pdf(input):
     try:
         log_message("Inside query_pdf")
-        log_message("Fetching the PDF...")
-        with httpx.Client() as client:
-            response = client.get(input["pdf_url"])
-            response.raise_for_status()
+        doc_id = vector_store.get_document_id(supabase, input["pdf_url"])
+        rows = vector_store.get_chunks(supabase, doc_id) if doc_id else []
 
-        pdf_binary = response.content
-
-        images = convert_from_bytes(pdf_binary)
+        if rows:
+            log_message(f"Found {len(rows)} indexed chunks.")
+            full_text = "\n".join(row["body"] for row in rows)
+        else:
+            log_message("Fetching the PDF...")
+            pdf_binary = downloader.read(input["pdf_url"])
 
-        log_message("Fetching successful.")
+            log_message("Fetching successful.")
 
-        text = ""
+            log_message("Extracting the text...")
+            full_text = "\n".join(
+                page["text"] for page in log_page_timings(iter_pages(pdf_binary))
+            )
 
-        log_message("Extracting the text...")
-        for img in images:
-            page_text = pytesseract.image_to_string(img, lang="eng+guj")
-            text += page_text + "\n"
+            log_message("Indexing the text...")
+            chunks = vector_store.split_text(full_text)
+            embeddings = vector_store.embed_in_batches(client, chunks)
+            rows = [
+                {"chunk_no": chunk_no, "body": chunk, "embedding": embedding}
+                for chunk_no, (chunk, embedding) in enumerate(
+                    zip(chunks, embeddings), start=1
+                )
+            ]
+            if doc_id:
+                # The answer only needs the rows in memory, storing them is
+                # for the next question about this document
+                try:
+                    vector_store.insert_chunks(supabase, doc_id, chunks, embeddings)
+                except Exception as e:
+                    log_message(f"Storing the chunks failed: {e}")
+
+        log_message("Retrieving the relevant chunks...")
+        query_embedding = vector_store.embed_texts(client, [input["query"]])[0]
+        relevant = vector_store.top_k(query_embedding, rows, QUERY_PDF_TOP_K)
+        relevant.sort(key=lambda row: row["chunk_no"])
+        text = "\n\n".join(row["body"] for row in relevant)
+
+        full_tokens = count_tokens(full_text)
+        used_tokens = count_tokens(text)
+        log_message(
+            f"Using {used_tokens} of {full_tokens} tokens "
+            f"({full_tokens - used_tokens} saved)."
+        )
 
         log_message("Generating the answer...")
         response = (
@@ -158,7 +193,7 @@ def query_pdf(input):
                 messages=[
                     {
                         "role": "system",
-                        "content": f"Given the text from the pdf, generate an answer to the user query.\n Text: {text}",
+                        "content": f"Given the relevant excerpts from the pdf, generate an answer to the user query.\n Text: {text}",
                     },
                     {"role": "user", "content": input["query"]},
                 ],
@@ -173,62 +208,42 @@ def query_pdf(input):
         return {"error": str(e)}
 
 
-def generate_query_with_llm(input):
-    system_prompt = """You are an assistant that generates Supabase queries in Python.
-    You must only generate queries that read data.
-    Do not generate any other types of queries like INSERT, UPDATE, or DELETE.
-    - Example:
-      Input: {"gr_no": "1234", "date": "2024-01", "branch": "Finance"}
-      Output:
-      query = supabase.table("documents").select("*").ilike("gr_no", "%1234%").gte("date", "2024-01-01").lt("date", "2024-02-01").ilike("branch", "%Finance%")
-    - If filtering by "date", always use `gte("date", "YYYY-MM-DD")` and `lt("date", "YYYY-MM-DD")` for the end of the month.
-    - If filtering by "gr_no", "branch", "subject_en" and "subject_gu", always use `ilike("gr_no", "%search_term%")`, `ilike("branch", "%search_term")`, `ilike("subject_en", "%search_term%")` and `ilike("subject_gu", "%search_term%")`.
-    Return only the Python code for the SELECT query (no explanations).
-    """
-
-    user_prompt = f"Generate a Supabase query for this input: {input}"
-
-    response = (
-        client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0,
-        )
-        .choices[0]
-        .message.content
-    )
-
-    if (
-        not response.strip().lower().startswith("query = supabase.table")
-        or "select" not in response.lower()
-    ):
-        raise ValueError(
-            "Only SELECT queries are allowed. Query generated is not a SELECT query."
-        )
-
-    return response
-
-
 def get_pdf_related_data(input):
     try:
-        log_message("Generating the query...")
-        query_code = generate_query_with_llm(input)
-        log_message(f"```{query_code}```")
-
-        if "select(" not in query_code:
-            return {"error": "Only SELECT queries are allowed"}
+        limit = input.pop("limit", None)
+        cursor = input.pop("cursor", None)
+        try:
+            limit = max(1, min(int(limit or DOCUMENTS_PAGE_SIZE), DOCUMENTS_MAX_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return {"error": f"Invalid limit {limit!r}, expected a number of rows"}
+        try:
+            offset = int(cursor or 0)
+        except (TypeError, ValueError):
+            offset = -1
+        if offset < 0:
+            return {
+                "error": f"Invalid cursor {cursor!r}, pass the 'next_cursor' "
+                "of a previous response or omit it for the first page"
+            }
+        columns = DOCUMENT_COLUMNS + (", subject_gu" if input.get("subject_gu") else "")
+
+        plan = compile_filters(input)
+        log_message(f"```{describe(plan)}```")
 
         log_message("Fetching data...")
-        exec(query_code, globals())
-        response = query.execute()
+        query = supabase.table("documents").select(columns, count="exact")
+        query = apply_filters(query, plan).order("date", desc=True).order("id")
+        response = query.range(offset, offset + limit - 1).execute()
 
         if response and hasattr(response, "data"):
-            log_message(f"Query successful, retrieved {len(response.data)} records.")
-            print(response.data)
-            return {"results": response.data}
+            total = response.count if response.count is not None else len(response.data)
+            log_message(
+                f"Query successful, retrieved {len(response.data)} of {total} records."
+            )
+            result = {"results": response.data, "total": total}
+            if offset + len(response.data) < total:
+                result["next_cursor"] = str(offset + len(response.data))
+            return result
         else:
             log_message("  Query returned an unexpected response.")
             return {"error": "Unexpected response format"}
@@ -240,28 +255,18 @@ def get_pdf_related_data(input):
 
 def get_pdf_by_content(input):
     try:
-        log_message("Generating the embeddings...")
-        emb = client.embeddings.create(
-            model="text-embedding-3-small", input=input["content"]
-        )
-        embedding = emb.data[0].embedding
-
         log_message("Searching for similar documents...")
-        # data = supabase.rpc(
-        #     "hybrid_search",
-        #     {
-        #         "query_text": input["content"],
-        #         "query_embedding": embedding,
-        #         "match_count": 10,
-        #     },
-        # ).execute()
-
-        data = supabase.rpc(
-            "match_documents",
-            {"query_embedding": embedding, "match_threshold": 0.78, "match_count": 10},
-        ).execute()
-
-        return {"results": data.data}
+        results, timings = hybrid_search.search(supabase, client, input["content"])
+        stats = embedding_cache.cache_stats()
+        log_message(
+            f"Embedding cache hit rate {stats['hit_rate']:.0%}, "
+            f"~{stats['saved_seconds']:.1f}s saved."
+        )
+        log_message(
+            "Search timings: "
+            + ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+        )
+        return {"results": results}
     except Exception as e:
         log_message(f"Error occurred: {e}")
         return {"error": str(e)}
@@ -343,9 +348,11 @@ def call_tool(tool_call):
 
 def run_agent(user_id, session_id, user_message):
     now = datetime.now()
-    result = supabase.table("documents").select("id", count="exact").execute()
-    total_records = result.count if result.count is not None else "N/A"
+    start = time.perf_counter()
+    total_records = corpus_stats.get_total_records(supabase)
+    total_records = total_records if total_records is not None else "N/A"
     print(now.strftime("%H:%M:%S %d-%m-%Y"))
+    print(f"Corpus stats took {(time.perf_counter() - start) * 1000:.1f}ms")
 
     system_prompt = f"""
         You are an AI assistant for querying and summarizing financial department documents. When you receive data from a tool call (presented as a 'tool' message in the conversation), please use that information to provide a complete answer. If the tool returns a list of documents, list them in your answer. If the query is ambiguous, ask clarifying questions.
@@ -360,7 +367,7 @@ def run_agent(user_id, session_id, user_message):
             "type": "function",
             "function": {
                 "name": "get_pdf_related_data",
-                "description": "Query database for PDFs using various criteria. Maintain the original language as input.",
+                "description": "Query database for PDFs using various criteria. Maintain the original language as input. Results are paginated, the response has the total count and a 'next_cursor' when more rows are available.",
                 "parameters": {
                     "type": "object",
                     "properties": {
@@ -370,7 +377,7 @@ def run_agent(user_id, session_id, user_message):
                         },
                         "date": {
                             "type": "string",
-                            "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019. For a range, use 'from_date' and 'to_date' instead.",
+                            "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019, financial year 2016-17. For a range, use 'from_date' and 'to_date' instead.",
                         },
                         "from_date": {
                             "type": "string",
@@ -415,6 +422,14 @@ def run_agent(user_id, session_id, user_message):
                             "type": "string",
                             "description": "Document subject in Gujarati. If the subject is in English, use 'subject_en' instead.",
                         },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Number of rows to return, at most 50. Defaults to 20.",
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": "The 'next_cursor' from a previous response, to fetch the next rows of the same query.",
+                        },
                     },
                 },
             },
@@ -460,7 +475,7 @@ def run_agent(user_id, session_id, user_message):
         #             "properties": {
         #                 "date": {
         #                     "type": "string",
-        #                     "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019. For a range, use 'from_date' and 'to_date' instead.",
+        #                     "description": "Date/Year e.g. 12/06/2005, 2023, Jan 2019, financial year 2016-17. For a range, use 'from_date' and 'to_date' instead.",
         #                 },
         #                 "from_date": {
         #                     "type": "string",
@@ -519,7 +534,9 @@ def run_agent(user_id, session_id, user_message):
     ]
 
     while True:
-        messages = get_chat_history(user_id, session_id)
+        messages = fit_history(
+            get_chat_history(user_id, session_id), summary_llm, user_id, session_id
+        )
         messages.insert(0, {"role": "system", "content": system_prompt})
         response = call_agent(messages, tools)
 
@@ -0,0 +1,113 @@
+import os
+import json
+import session_store
+from tokens import count_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 12000))
+TOOL_DIGEST_CHARS = 400
+SUMMARY_PROMPT = (
+    "Summarize this earlier part of a conversation between a user and an assistant "
+    "for financial department documents. Keep GR numbers, dates, branches, PDF URLs "
+    "and the answers that were given. If a previous summary is included, extend it."
+)
+
+
+def split_turns(messages):
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def digest_tool_message(message):
+    content = message.get("content") or ""
+    if len(content) <= TOOL_DIGEST_CHARS:
+        return message
+
+    try:
+        payload = json.loads(content)
+    except json.JSONDecodeError:
+        payload = None
+
+    note = f"[truncated from {len(content)} characters"
+    if isinstance(payload, dict) and isinstance(payload.get("results"), list):
+        note += f", {len(payload['results'])} results"
+    note += "]"
+
+    return {**message, "content": content[:TOOL_DIGEST_CHARS] + "... " + note}
+
+
+def _message_tokens(message):
+    tokens = count_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += count_tokens(json.dumps(tool_call["function"]))
+    return tokens + 4
+
+
+def _render(messages):
+    lines = []
+    for message in messages:
+        if message.get("tool_calls"):
+            for tool_call in message["tool_calls"]:
+                function = tool_call["function"]
+                lines.append(f"assistant called {function['name']}({function['arguments']})")
+        if message.get("content"):
+            lines.append(f"{message['role']}: {digest_tool_message(message)['content']}")
+    return "\n".join(lines)
+
+
+def _rolling_summary(folded, summarize, user_id, session_id):
+    cached_count, summary = 0, ""
+    if user_id is not None:
+        cached_count, summary = session_store.get_rolling_summary(user_id, session_id)
+        if cached_count > len(folded):
+            cached_count, summary = 0, ""
+
+    if cached_count == len(folded):
+        return summary
+
+    # Only the turns folded since the cached summary are summarized again
+    text = _render(folded[cached_count:])
+    if summary:
+        text = f"Previous summary:\n{summary}\n\nConversation:\n{text}"
+    summary = summarize(text, SUMMARY_PROMPT)
+
+    if user_id is not None:
+        session_store.put_rolling_summary(user_id, session_id, len(folded), summary)
+    return summary
+
+
+def fit_history(
+    messages, summarize, user_id=None, session_id=None, budget=HISTORY_TOKEN_BUDGET
+):
+    turns = split_turns(messages)
+    if not turns:
+        return []
+
+    # The current turn is always sent as is, older turns lose their verbose
+    # tool payloads and are kept newest first while they fit
+    kept = [turns[-1]]
+    used = sum(_message_tokens(message) for message in turns[-1])
+    for turn in reversed(turns[:-1]):
+        compact = [
+            digest_tool_message(message) if message["role"] == "tool" else message
+            for message in turn
+        ]
+        tokens = sum(_message_tokens(message) for message in compact)
+        if used + tokens > budget:
+            break
+        kept.insert(0, compact)
+        used += tokens
+
+    folded_turns = turns[: len(turns) - len(kept)]
+    window = [message for turn in kept for message in turn]
+    if not folded_turns:
+        return window
+
+    folded = [message for turn in folded_turns for message in turn]
+    summary = _rolling_summary(folded, summarize, user_id, session_id)
+    return [
+        {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+    ] + window
@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+from local_db import CACHE_DIR
+
+CORPUS_STATS_TTL = int(os.environ.get("CORPUS_STATS_TTL", 600))
+CORPUS_STATS_STAMP = os.path.join(CACHE_DIR, "corpus_stats.stamp")
+
+_lock = threading.Lock()
+_stats = {"total_records": None, "exact": False, "refreshed_at": 0.0}
+_refreshing = False
+
+
+def invalidate():
+    os.makedirs(os.path.dirname(CORPUS_STATS_STAMP) or ".", exist_ok=True)
+    with open(CORPUS_STATS_STAMP, "a"):
+        os.utime(CORPUS_STATS_STAMP)
+
+
+def _invalidated_at():
+    try:
+        return os.path.getmtime(CORPUS_STATS_STAMP)
+    except FileNotFoundError:
+        return 0.0
+
+
+def count_documents(supabase, count="exact"):
+    result = supabase.table("documents").select("id", count=count).limit(1).execute()
+    return result.count
+
+
+def _refresh(supabase):
+    global _refreshing
+    try:
+        total = count_documents(supabase, "exact")
+        with _lock:
+            _stats.update(total_records=total, exact=True, refreshed_at=time.time())
+    except Exception as e:
+        print(f"Corpus count failed: {e}")
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def _refresh_in_background(supabase):
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=_refresh, args=(supabase,), daemon=True).start()
+
+
+def get_total_records(supabase):
+    with _lock:
+        total = _stats["total_records"]
+        refreshed_at = _stats["refreshed_at"]
+
+    if total is None:
+        # First call in this process: the planner's estimate is cheap, the
+        # exact count is fetched off the request path
+        try:
+            total = count_documents(supabase, "estimated")
+        except Exception:
+            total = None
+        with _lock:
+            if _stats["total_records"] is None:
+                _stats["total_records"] = total
+        _refresh_in_background(supabase)
+    elif time.time() - refreshed_at > CORPUS_STATS_TTL or _invalidated_at() > refreshed_at:
+        _refresh_in_background(supabase)
+
+    return total
@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import local_db
+from local_db import CACHE_DIR
+
+BLOB_DIR = os.path.join(CACHE_DIR, "blobs")
+PARTIAL_DIR = os.path.join(BLOB_DIR, "partial")
+BLOB_INDEX_PATH = os.path.join(BLOB_DIR, "index.sqlite3")
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", 16))
+# Files at least this large are fetched as parallel byte ranges
+SEGMENT_THRESHOLD = 8 * 1024 * 1024
+SEGMENT_SIZE = 4 * 1024 * 1024
+SEGMENT_WORKERS = 8
+READ_CHUNK_SIZE = 64 * 1024
+MAX_RETRIES = 3
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("DOWNLOAD_CACHE_MAX_BYTES", 2 * 1024**3))
+# Blobs used this recently stay even above the cap, a caller may still be
+# about to open the path download() returned
+EVICT_MIN_AGE = 600
+
+http = httpx.Client(
+    timeout=httpx.Timeout(60, connect=10),
+    limits=httpx.Limits(
+        max_connections=DOWNLOAD_CONNECTIONS,
+        max_keepalive_connections=DOWNLOAD_CONNECTIONS,
+    ),
+    follow_redirects=True,
+)
+
+_url_locks = {}
+_url_locks_lock = threading.Lock()
+
+
+class _Restart(Exception):
+    # The server no longer serves the bytes the partial download started with
+    pass
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            last_used REAL
+        )"""
+    )
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(urls)")]
+    if "last_used" not in columns:
+        conn.execute("ALTER TABLE urls ADD COLUMN last_used REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS urls_sha256 ON urls (sha256)")
+
+
+def _connect():
+    return local_db.connect(BLOB_INDEX_PATH, _create_tables)
+
+
+def _url_lock(url):
+    with _url_locks_lock:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def blob_path(sha256):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+def lookup(url):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT sha256, size, etag, last_modified FROM urls WHERE url = ?", (url,)
+        ).fetchone()
+        if row is not None:
+            conn.execute("UPDATE urls SET last_used = ? WHERE url = ?", (time.time(), url))
+    if row is None or not os.path.exists(blob_path(row[0])):
+        return None
+    return {
+        "sha256": row[0],
+        "size": row[1],
+        "etag": row[2],
+        "last_modified": row[3],
+        "path": blob_path(row[0]),
+    }
+
+
+def _remember(url, info):
+    with _connect() as conn:
+        old = conn.execute("SELECT sha256 FROM urls WHERE url = ?", (url,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO urls "
+            "(url, sha256, size, etag, last_modified, fetched_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                url,
+                info["sha256"],
+                info["size"],
+                info["etag"],
+                info["last_modified"],
+                time.time(),
+                time.time(),
+            ),
+        )
+        # The bytes the URL served before, unless another URL still has them
+        if old and old[0] != info["sha256"]:
+            shared = conn.execute(
+                "SELECT 1 FROM urls WHERE sha256 = ? LIMIT 1", (old[0],)
+            ).fetchone()
+            if shared is None and os.path.exists(blob_path(old[0])):
+                os.unlink(blob_path(old[0]))
+
+
+def _partial_prefix(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(PARTIAL_DIR, key)
+
+
+def _load_partial(prefix):
+    try:
+        with open(prefix + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_partial(prefix, meta):
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    with open(prefix + ".json.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(prefix + ".json.tmp", prefix + ".json")
+
+
+def _discard_partial(prefix, meta):
+    for n in range(len(meta["segments"]) if meta else 0):
+        if os.path.exists(f"{prefix}.{n}.part"):
+            os.unlink(f"{prefix}.{n}.part")
+    if os.path.exists(prefix + ".json"):
+        os.unlink(prefix + ".json")
+
+
+def _write_body(response, part_path):
+    with open(part_path, "ab") as f:
+        for data in response.iter_bytes(READ_CHUNK_SIZE):
+            f.write(data)
+
+
+def _fetch_segment(url, part_path, start, end, validator):
+    for attempt in range(MAX_RETRIES):
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if end is not None and start + done > end:
+            return
+        headers = {"Range": f"bytes={start + done}-{'' if end is None else end}"}
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            with http.stream("GET", url, headers=headers) as response:
+                if response.status_code != 206:
+                    raise _Restart()
+                _write_body(response, part_path)
+            if end is None:
+                return
+        except httpx.HTTPError as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            print(f"Retrying {url} bytes {start + done}- after error: {e}")
+            time.sleep(2**attempt)
+
+
+def _plan_segments(size):
+    if size < SEGMENT_THRESHOLD:
+        return [[0, size - 1]]
+    return [
+        [start, min(start + SEGMENT_SIZE, size) - 1]
+        for start in range(0, size, SEGMENT_SIZE)
+    ]
+
+
+def _fetch_segments(url, prefix, meta):
+    validator = meta["etag"] or meta["last_modified"]
+    segments = meta["segments"]
+    with ThreadPoolExecutor(max_workers=min(SEGMENT_WORKERS, len(segments))) as executor:
+        futures = [
+            executor.submit(_fetch_segment, url, f"{prefix}.{n}.part", start, end, validator)
+            for n, (start, end) in enumerate(segments)
+        ]
+        for future in futures:
+            future.result()
+
+
+def _download(url, headers):
+    prefix = _partial_prefix(url)
+    meta = _load_partial(prefix)
+
+    if meta and (meta["etag"] or meta["last_modified"]) and meta["size"] is not None:
+        # Carry on with the byte ranges that are still missing
+        try:
+            _fetch_segments(url, prefix, meta)
+            return prefix, meta
+        except _Restart:
+            _discard_partial(prefix, meta)
+    elif meta:
+        _discard_partial(prefix, meta)
+
+    with http.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304:
+            return None, None
+        response.raise_for_status()
+
+        length = response.headers.get("content-length")
+        encoded = response.headers.get("content-encoding", "identity") != "identity"
+        size = int(length) if length and not encoded else None
+        meta = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "size": size,
+            "segments": _plan_segments(size) if size else [[0, None]],
+        }
+        ranged = response.headers.get("accept-ranges") == "bytes"
+        _save_partial(prefix, meta)
+
+        if not (ranged and len(meta["segments"]) > 1):
+            # One stream, still resumable from part 0 if the server takes ranges
+            _write_body(response, f"{prefix}.0.part")
+            return prefix, meta
+
+    _fetch_segments(url, prefix, meta)
+    return prefix, meta
+
+
+def _store(prefix, meta):
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = f"{prefix}.blob"
+    with open(tmp_path, "wb") as out:
+        for n in range(len(meta["segments"])):
+            with open(f"{prefix}.{n}.part", "rb") as f:
+                while data := f.read(READ_CHUNK_SIZE):
+                    digest.update(data)
+                    out.write(data)
+                    size += len(data)
+
+    if meta["size"] is not None and size != meta["size"]:
+        os.unlink(tmp_path)
+        _discard_partial(prefix, meta)
+        raise ValueError(f"Expected {meta['size']} bytes, got {size}")
+
+    sha256 = digest.hexdigest()
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The same content under another URL is stored once
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    _discard_partial(prefix, meta)
+    return {"sha256": sha256, "size": size, "path": path}
+
+
+def _conditional_headers(etag, last_modified):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def is_modified(url, etag, last_modified):
+    # Asks whether url changed since the given validators without fetching
+    # or storing the body. Servers without HEAD get a conditional GET that is
+    # closed before the body is read
+    headers = _conditional_headers(etag, last_modified)
+    if not headers:
+        return True
+    response = http.head(url, headers=headers)
+    if response.status_code in (405, 501):
+        with http.stream("GET", url, headers=headers) as response:
+            pass
+    if response.status_code == 304:
+        return False
+    response.raise_for_status()
+    return True
+
+
+def download(url, revalidate=False, force=False):
+    # Returns the blob for url, fetching it only if it isn't stored yet. With
+    # revalidate a conditional request checks the stored copy is still current
+    with _url_lock(url):
+        known = None if force else lookup(url)
+        if known and not revalidate:
+            return {**known, "status": "cached"}
+
+        headers = _conditional_headers(known["etag"], known["last_modified"]) if known else {}
+
+        prefix, meta = _download(url, headers)
+        if prefix is None:
+            return {**known, "status": "not_modified"}
+
+        info = _store(prefix, meta)
+        info.update(etag=meta["etag"], last_modified=meta["last_modified"])
+        _remember(url, info)
+    evict()
+    return {**info, "status": "downloaded"}
+
+
+def evict(max_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+    # Least recently used blobs go first. A blob is shared by every URL that
+    # served the same bytes, so it is as recent as its most recent URL
+    with _connect() as conn:
+        blobs = conn.execute(
+            "SELECT sha256, MAX(size), MAX(COALESCE(last_used, fetched_at)) "
+            "FROM urls GROUP BY sha256 ORDER BY 3"
+        ).fetchall()
+        total = sum(size for _, size, _ in blobs)
+        if total <= max_bytes:
+            return 0
+
+        evicted = 0
+        now = time.time()
+        for sha256, size, last_used in blobs:
+            if total <= max_bytes or now - last_used < EVICT_MIN_AGE:
+                break
+            conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+            if os.path.exists(blob_path(sha256)):
+                os.unlink(blob_path(sha256))
+            total -= size
+            evicted += 1
+    return evicted
+
+
+def read(url, **kwargs):
+    info = download(url, **kwargs)
+    with open(info["path"], "rb") as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    # Usage: python downloader.py <url> [output]
+    start = time.perf_counter()
+    info = download(sys.argv[1], force=True)
+    seconds = time.perf_counter() - start
+    print(
+        f"{info['size'] / 2**20:.1f}MB in {seconds:.2f}s "
+        f"({info['size'] / 2**20 / seconds:.1f}MB/s), sha256 {info['sha256']}"
+    )
+    if len(sys.argv) > 2:
+        shutil.copyfile(info["path"], sys.argv[2])
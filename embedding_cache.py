@@ -0,0 +1,186 @@
+import os
+import time
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+import local_db
+from local_db import CACHE_DIR
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+FULL_DIMENSIONS = 1536
+# text-embedding-3 models are trained so that a prefix of the vector is itself
+# a usable embedding, the API truncates and renormalizes when asked
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", FULL_DIMENSIONS))
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+EMBEDDING_MEMORY_ITEMS = int(os.environ.get("EMBEDDING_MEMORY_ITEMS", 2048))
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+)
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "requests": 0,
+    "request_seconds": 0.0,
+}
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            last_used REAL NOT NULL DEFAULT 0
+        )"""
+    )
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(embeddings)")]
+    if "size" not in columns:
+        conn.execute("ALTER TABLE embeddings ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        conn.execute("UPDATE embeddings SET size = LENGTH(vector)")
+    conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+
+def _connect():
+    return local_db.connect(EMBEDDING_CACHE_PATH, _create_tables)
+
+
+def normalize(text):
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+def cache_key(text, model, dimensions=FULL_DIMENSIONS):
+    if dimensions != FULL_DIMENSIONS:
+        model = f"{model}:{dimensions}"
+    return hashlib.sha256(f"{model}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector):
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def _remember(key, vector):
+    with _lock:
+        _memory[key] = vector
+        _memory.move_to_end(key)
+        while len(_memory) > EMBEDDING_MEMORY_ITEMS:
+            _memory.popitem(last=False)
+
+
+def embed(client, texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+    keys = [cache_key(text, model, dimensions) for text in texts]
+    found = {}
+
+    with _lock:
+        for key in keys:
+            if key in _memory:
+                _memory.move_to_end(key)
+                found[key] = _memory[key]
+    in_memory = set(found)
+
+    lookup = list({key for key in keys if key not in found})
+    if lookup:
+        with _connect() as conn:
+            for start in range(0, len(lookup), 500):
+                batch = lookup[start : start + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = _unpack(blob)
+                    _remember(key, found[key])
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, normalize(text))
+
+    with _lock:
+        _stats["memory_hits"] += sum(1 for key in keys if key in in_memory)
+        _stats["disk_hits"] += sum(
+            1 for key in keys if key in found and key not in in_memory
+        )
+        _stats["misses"] += sum(1 for key in keys if key in missing)
+
+    if missing:
+        start = time.perf_counter()
+        options = {"dimensions": dimensions} if dimensions != FULL_DIMENSIONS else {}
+        response = client.embeddings.create(
+            model=model, input=list(missing.values()), **options
+        )
+        seconds = time.perf_counter() - start
+
+        with _lock:
+            _stats["requests"] += 1
+            _stats["request_seconds"] += seconds
+
+        now = time.time()
+        rows = []
+        for key, item in zip(missing, response.data):
+            blob = _pack(item.embedding)
+            rows.append((key, model, blob, len(blob), now))
+        with _connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        for key, item in zip(missing, response.data):
+            found[key] = item.embedding
+            _remember(key, item.embedding)
+        evict()
+
+    return [found[key] for key in keys]
+
+
+def evict(max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+    # Ingestion embeds every chunk once, so without a cap the disk tier grows
+    # with the corpus. Least recently used vectors go first
+    with _connect() as conn:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+
+        evicted = []
+        rows = conn.execute("SELECT key, size FROM embeddings ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if total <= max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+    return len(evicted)
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+
+    hits = stats["memory_hits"] + stats["disk_hits"]
+    lookups = hits + stats["misses"]
+    request_seconds = (
+        stats["request_seconds"] / stats["requests"] if stats["requests"] else 0.0
+    )
+    stats["hit_rate"] = hits / lookups if lookups else 0.0
+    # Estimated as one API round trip per hit, which is what a repeated
+    # search query would have cost
+    stats["saved_seconds"] = hits * request_seconds
+    return stats
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from bs4 import BeautifulSoup
+
+SITE_URL = "https://financedepartment.gujarat.gov.in"
+# Dropdown entries the crawl visits, the rest are placeholders
+BRANCH_SLICE = slice(3, -2)
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+def parse_branches(html):
+    soup = BeautifulSoup(html, HTML_PARSER)
+    select = soup.find("select")
+    if select is None:
+        return []
+    options = select.find_all("option")[BRANCH_SLICE]
+    return [
+        (option.get("value", option.text.strip()), option.text.strip())
+        for option in options
+    ]
+
+
+def parse_table(html, branch):
+    soup = BeautifulSoup(html, HTML_PARSER)
+    table = soup.find("table", class_="table")
+    if table is None:
+        return None
+
+    rows = []
+    for row in table.find_all("tr"):
+        cols = row.find_all("td")
+        if len(cols) == 4:
+            link = cols[3].find("a")
+            pdf_link = link["href"] if link and link.get("href") else None
+            rows.append(
+                {
+                    "gr_no": cols[0].text.strip(),
+                    "date": cols[1].text.strip(),
+                    "branch": branch,
+                    "subject": cols[2].text.strip(),
+                    "pdf_url": f"{SITE_URL}/{pdf_link}" if pdf_link else None,
+                }
+            )
+    return rows
+
+
+def fingerprint(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(f"{row['gr_no']}\0{row['date']}\0{row['pdf_url']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RateLimiter:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.delay
+        if wait > 0:
+            time.sleep(wait)
+
+
+def iter_branches_http(base_url, branch_url, concurrency=4, delay=0.5):
+    limiter = RateLimiter(delay)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(timeout=30, limits=limits, follow_redirects=True) as http:
+
+        def fetch(url):
+            limiter.wait()
+            response = http.get(url)
+            response.raise_for_status()
+            return response.text
+
+        branches = parse_branches(fetch(base_url))
+        if not branches:
+            raise ValueError(f"No branch dropdown found on {base_url}")
+
+        urls = [branch_url.format(value=value, name=name) for value, name in branches]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for (_, name), html in zip(branches, executor.map(fetch, urls)):
+                yield name, html
+
+
+def iter_branch_rows_http(base_url, branch_url, **kwargs):
+    # A branch URL the site ignores serves the same default table for every
+    # branch. Nothing is handed out before two branches with different
+    # tables were seen, and any repeat after that stops the crawl
+    seen = {}
+    held = []
+    for branch, html in iter_branches_http(base_url, branch_url, **kwargs):
+        rows = parse_table(html, branch)
+        if rows is None:
+            raise ValueError(f"No table in the response for {branch}")
+        if rows:
+            key = fingerprint(rows)
+            if key in seen:
+                raise ValueError(
+                    f"{branch} and {seen[key]} returned the same table, "
+                    f"{branch_url} does not select a branch"
+                )
+            seen[key] = branch
+
+        held.append((branch, rows))
+        if len(seen) >= 2:
+            yield from held
+            held = []
+    yield from held
+
+
+def save_fixtures(directory, branches):
+    # branches yields (branch, table html), e.g. from a Selenium crawl
+    os.makedirs(directory, exist_ok=True)
+    names = {}
+    for n, (branch, html) in enumerate(branches):
+        names[branch] = f"{n:03}.html"
+        with open(os.path.join(directory, names[branch]), "w", encoding="utf-8") as f:
+            f.write(html)
+    with open(os.path.join(directory, "branches.json"), "w", encoding="utf-8") as f:
+        json.dump(names, f, ensure_ascii=False, indent=1)
+    return len(names)
+
+
+def load_fixtures(directory):
+    with open(os.path.join(directory, "branches.json"), encoding="utf-8") as f:
+        names = json.load(f)
+    fixtures = {}
+    for branch, name in names.items():
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            fixtures[branch] = parse_table(f.read(), branch) or []
+    return fixtures
+
+
+def compare_with_fixtures(fixtures, fetched):
+    # fixtures and fetched map branch -> rows. Returns a list of mismatches
+    problems = []
+    for branch, expected in fixtures.items():
+        if branch not in fetched:
+            problems.append(f"{branch}: missing from the HTTP crawl")
+            continue
+        want = {row["gr_no"] for row in expected}
+        got = {row["gr_no"] for row in fetched[branch]}
+        # The site may have published new GRs since the fixtures were saved
+        if not want <= got:
+            problems.append(
+                f"{branch}: {len(want - got)} of {len(want)} saved GRs not in the HTTP table"
+            )
+    return problems
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import lexical_index
+import vector_store
+
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "hybrid")
+MATCH_THRESHOLD = 0.78
+CANDIDATES = 30
+RRF_K = 60
+
+
+def _key(row):
+    # match_documents rows carry no chunk_no, the body identifies the chunk
+    return (row.get("doc_id"), row.get("body"))
+
+
+def fuse(*rankings, k=RRF_K):
+    # Reciprocal rank fusion only uses ranks, so BM25 scores and cosine
+    # similarities never need to be put on a common scale
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            entry = fused.setdefault(_key(row), {**row, "rrf_score": 0.0})
+            entry["rrf_score"] += 1 / (k + rank)
+            entry.update({name: value for name, value in row.items() if name not in entry})
+    return sorted(fused.values(), key=lambda row: row["rrf_score"], reverse=True)
+
+
+def vector_search(supabase, embedding, k, threshold=MATCH_THRESHOLD):
+    if vector_store.VECTOR_SEARCH == "local":
+        import vector_index
+
+        index = vector_index.get_index()
+        index.sync_in_background(supabase)
+        return index.search(embedding, k, threshold=threshold)
+
+    return (
+        supabase.rpc(
+            "match_documents",
+            {
+                "query_embedding": embedding,
+                "match_threshold": threshold,
+                "match_count": k,
+            },
+        )
+        .execute()
+        .data
+    )
+
+
+def search(supabase, client, text, k=10, mode=None):
+    mode = mode or SEARCH_MODE
+    timings = {}
+
+    start = time.perf_counter()
+    embedding = vector_store.embed_texts(client, [text])[0]
+    timings["embed"] = time.perf_counter() - start
+
+    if mode == "vector":
+        start = time.perf_counter()
+        results = vector_search(supabase, embedding, k)
+        timings["vector"] = time.perf_counter() - start
+        return results, timings
+
+    start = time.perf_counter()
+    vector_hits = vector_search(supabase, embedding, CANDIDATES)
+    timings["vector"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lexical_index.sync_in_background(supabase)
+    lexical_hits = lexical_index.search(text, CANDIDATES)
+    timings["lexical"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = fuse(vector_hits, lexical_hits)[:k]
+    timings["fuse"] = time.perf_counter() - start
+    return results, timings
+
+
+def compare(supabase, client, labeled, k=10):
+    # labeled: [{"query": ..., "doc_ids": [...]}], a hit is any relevant
+    # document among the top k chunks
+    recall = {"vector": [], "hybrid": []}
+    for case in labeled:
+        relevant = set(case["doc_ids"])
+        for mode in recall:
+            results, _ = search(supabase, client, case["query"], k, mode)
+            found = {row.get("doc_id") for row in results} & relevant
+            recall[mode].append(len(found) / len(relevant))
+    return {mode: sum(values) / len(values) for mode, values in recall.items()}
+
+
+if __name__ == "__main__":
+    # Usage: python hybrid_search.py <labeled.jsonl>
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    from supabase import create_client
+
+    load_dotenv()
+    supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    with open(sys.argv[1], encoding="utf-8") as f:
+        labeled = [json.loads(line) for line in f if line.strip()]
+
+    for mode, value in compare(supabase, OpenAI(), labeled).items():
+        print(f"{mode:6} recall@10={value:.3f} over {len(labeled)} queries")
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import local_db
+from local_db import CACHE_DIR
+
+INDEX_STATE_PATH = os.path.join(CACHE_DIR, "index_state.sqlite3")
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS checkpoints (
+            doc_id INTEGER PRIMARY KEY,
+            pdf_url TEXT,
+            stage TEXT NOT NULL,
+            chunks INTEGER,
+            error TEXT,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS document_state (
+            doc_id INTEGER PRIMARY KEY,
+            pdf_url TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT NOT NULL,
+            config_hash TEXT NOT NULL,
+            chunk_hashes TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )"""
+    )
+
+
+def _connect():
+    return local_db.connect(INDEX_STATE_PATH, _create_tables)
+
+
+def get_document_state(doc_id):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT etag, last_modified, content_hash, config_hash, chunk_hashes "
+            "FROM document_state WHERE doc_id = ?",
+            (doc_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "etag": row[0],
+        "last_modified": row[1],
+        "content_hash": row[2],
+        "config_hash": row[3],
+        "chunk_hashes": json.loads(row[4]),
+    }
+
+
+def put_document_state(
+    doc_id, pdf_url, etag, last_modified, content_hash, config_hash, chunk_hashes
+):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO document_state "
+            "(doc_id, pdf_url, etag, last_modified, content_hash, config_hash, chunk_hashes, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                doc_id,
+                pdf_url,
+                etag,
+                last_modified,
+                content_hash,
+                config_hash,
+                json.dumps(chunk_hashes),
+                time.time(),
+            ),
+        )
+
+
+def update_validators(doc_id, etag, last_modified):
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE document_state SET etag = ?, last_modified = ?, updated_at = ? WHERE doc_id = ?",
+            (etag, last_modified, time.time(), doc_id),
+        )
+
+
+def set_stage(doc_id, pdf_url, stage, chunks=None, error=None):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (doc_id, pdf_url, stage, chunks, error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (doc_id, pdf_url, stage, chunks, error, time.time()),
+        )
+
+
+def stage_counts():
+    with _connect() as conn:
+        return dict(
+            conn.execute("SELECT stage, COUNT(*) FROM checkpoints GROUP BY stage").fetchall()
+        )
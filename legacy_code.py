@@ -1,9 +1,10 @@
-import os
+import shutil
+import downloader
 
 url = "https://financedepartment.gujarat.gov.in/Documents/CH_275_10-Jun-1971_564.pdf"
 output_path = "CH_275_10-Jun-1971_564.pdf"
 
-os.system(f'aria2c -x 16 -s 16 -o "{output_path}" "{url}"')
+shutil.copyfile(downloader.download(url)["path"], output_path)
 
 
 def get_pdf_related_data(input):
@@ -0,0 +1,277 @@
+import os
+import re
+import sys
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter
+import local_db
+from local_db import CACHE_DIR
+from query_compiler import GUJARATI_DIGITS
+
+LEXICAL_INDEX_PATH = os.path.join(CACHE_DIR, "lexical.sqlite3")
+SYNC_PAGE_SIZE = 1000
+# Concurrent writers can commit ids out of order, so this many ids below the
+# newest one seen are listed again on every sync
+SYNC_RESCAN_IDS = 5000
+# ids per in.() filter, keeps the request URL well under proxy limits
+SYNC_FETCH_IDS = 300
+LEXICAL_SYNC_SECONDS = int(os.environ.get("LEXICAL_SYNC_SECONDS", 300))
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[0-9a-z઀-૿]+")
+STOPWORDS = {"a", "an", "and", "the", "of", "to", "in", "for", "on", "by", "is", "at"}
+
+_sync_lock = threading.Lock()
+_sync_state = {"synced_at": 0.0, "syncing": False}
+
+
+def tokenize(text):
+    # Gujarati vowel signs are not \w, so the script's whole block is matched
+    # explicitly, and Gujarati digits are folded so ૨૦૨૪ matches 2024
+    text = unicodedata.normalize("NFC", text).casefold().translate(GUJARATI_DIGITS)
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS chunks (
+            chunk_key TEXT PRIMARY KEY,
+            doc_id INTEGER,
+            chunk_no INTEGER,
+            body TEXT NOT NULL,
+            length INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id, chunk_no)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            chunk_key TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (term, chunk_key)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_key)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+
+def _connect():
+    return local_db.connect(LEXICAL_INDEX_PATH, _create_tables)
+
+
+def _delete(conn, chunk_keys):
+    conn.executemany("DELETE FROM postings WHERE chunk_key = ?", [(k,) for k in chunk_keys])
+    conn.executemany("DELETE FROM chunks WHERE chunk_key = ?", [(k,) for k in chunk_keys])
+
+
+def add_chunks(rows):
+    with _connect() as conn:
+        keys = [f"{row['doc_id']}:{row['chunk_no']}" for row in rows]
+        _delete(conn, keys)
+        for key, row in zip(keys, rows):
+            tokens = tokenize(row["body"])
+            conn.execute(
+                "INSERT INTO chunks (chunk_key, doc_id, chunk_no, body, length) VALUES (?, ?, ?, ?, ?)",
+                (key, row["doc_id"], row["chunk_no"], row["body"], len(tokens)),
+            )
+            conn.executemany(
+                "INSERT INTO postings (term, chunk_key, tf) VALUES (?, ?, ?)",
+                [(term, key, tf) for term, tf in Counter(tokens).items()],
+            )
+
+
+def remove_chunks(doc_id, chunk_nos=None):
+    with _connect() as conn:
+        if chunk_nos is None:
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT chunk_key FROM chunks WHERE doc_id = ?", (doc_id,)
+                )
+            ]
+        else:
+            keys = [f"{doc_id}:{chunk_no}" for chunk_no in chunk_nos]
+        _delete(conn, keys)
+
+
+def search(text, k=10):
+    terms = set(tokenize(text))
+    if not terms:
+        return []
+
+    with _connect() as conn:
+        total, avg_length = conn.execute(
+            "SELECT COUNT(*), COALESCE(AVG(length), 0) FROM chunks"
+        ).fetchone()
+        if not total:
+            return []
+
+        scores = Counter()
+        for term in terms:
+            postings = conn.execute(
+                "SELECT p.chunk_key, p.tf, c.length FROM postings p "
+                "JOIN chunks c ON c.chunk_key = p.chunk_key WHERE p.term = ?",
+                (term,),
+            ).fetchall()
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_key, tf, length in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                scores[chunk_key] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = scores.most_common(k)
+        rows = {
+            row[0]: row
+            for row in conn.execute(
+                f"SELECT chunk_key, doc_id, chunk_no, body FROM chunks "
+                f"WHERE chunk_key IN ({','.join('?' * len(best))})",
+                [key for key, _ in best],
+            )
+        } if best else {}
+
+    return [
+        {
+            "doc_id": rows[key][1],
+            "chunk_no": rows[key][2],
+            "body": rows[key][3],
+            "score": score,
+        }
+        for key, score in best
+    ]
+
+
+def _remote_keys(supabase, after=0, until=None):
+    # chunk_key -> id of the vectors rows in (after, until]
+    keys = {}
+    while True:
+        query = supabase.table("vectors").select("id, doc_id, chunk_no").gt("id", after)
+        if until is not None:
+            query = query.lte("id", until)
+        rows = query.order("id").limit(SYNC_PAGE_SIZE).execute().data
+        if not rows:
+            return keys
+        keys.update((f"{row['doc_id']}:{row['chunk_no']}", row["id"]) for row in rows)
+        after = rows[-1]["id"]
+
+
+def _indexed(keys):
+    found = set()
+    with _connect() as conn:
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            found.update(
+                row[0]
+                for row in conn.execute(
+                    f"SELECT chunk_key FROM chunks WHERE chunk_key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+    return found
+
+
+def _add_ids(supabase, ids):
+    for start in range(0, len(ids), SYNC_FETCH_IDS):
+        add_chunks(
+            supabase.table("vectors")
+            .select("id, doc_id, chunk_no, body")
+            .in_("id", ids[start : start + SYNC_FETCH_IDS])
+            .execute()
+            .data
+        )
+    return len(ids)
+
+
+def _add_new(supabase):
+    with _connect() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'last_id'").fetchone()
+    last_id = row[0] if row else 0
+
+    window = _remote_keys(supabase, max(0, last_id - SYNC_RESCAN_IDS), last_id)
+    indexed = _indexed(list(window))
+    added = _add_ids(supabase, sorted(i for key, i in window.items() if key not in indexed))
+    while True:
+        rows = (
+            supabase.table("vectors")
+            .select("id, doc_id, chunk_no, body")
+            .gt("id", last_id)
+            .order("id")
+            .limit(SYNC_PAGE_SIZE)
+            .execute()
+            .data
+        )
+        if not rows:
+            return added
+        add_chunks(rows)
+        added += len(rows)
+        last_id = rows[-1]["id"]
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_id', ?)", (last_id,)
+            )
+
+
+def _reconcile(supabase):
+    # Picks up rows committed below the rescan window and drops chunks
+    # deleted upstream. The remote keys are only listed when the counts
+    # disagree
+    remote = supabase.table("vectors").select("id", count="exact").limit(1).execute().count
+    with _connect() as conn:
+        local = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    if remote is None or local == remote:
+        return 0, 0
+
+    keys = _remote_keys(supabase)
+    with _connect() as conn:
+        indexed = {row[0] for row in conn.execute("SELECT chunk_key FROM chunks")}
+        stale = [key for key in indexed if key not in keys]
+        _delete(conn, stale)
+    missing = sorted(i for key, i in keys.items() if key not in indexed)
+    return _add_ids(supabase, missing), len(stale)
+
+
+def sync(supabase):
+    added = _add_new(supabase)
+    reconciled, removed = _reconcile(supabase)
+    added += reconciled
+    with _sync_lock:
+        _sync_state["synced_at"] = time.time()
+    return added, removed
+
+
+def sync_in_background(supabase):
+    with _sync_lock:
+        if (
+            _sync_state["syncing"]
+            or time.time() - _sync_state["synced_at"] < LEXICAL_SYNC_SECONDS
+        ):
+            return
+        _sync_state["syncing"] = True
+
+    def run():
+        try:
+            sync(supabase)
+        except Exception as e:
+            print(f"Lexical index sync failed: {e}")
+        finally:
+            with _sync_lock:
+                _sync_state["syncing"] = False
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Usage: python lexical_index.py sync | python lexical_index.py search <text>
+    if sys.argv[1] == "sync":
+        from dotenv import load_dotenv
+        from supabase import create_client
+
+        load_dotenv()
+        supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+        added, removed = sync(supabase)
+        print(f"Indexed {added} chunks, removed {removed} deleted upstream")
+    else:
+        for row in search(" ".join(sys.argv[2:])):
+            print(f"{row['score']:.2f} doc {row['doc_id']} chunk {row['chunk_no']}: {row['body'][:80]!r}")
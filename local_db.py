@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import threading
+
+CACHE_DIR = os.environ.get("FINBOT_CACHE_DIR", ".cache")
+
+_local = threading.local()
+_created = set()
+_created_lock = threading.Lock()
+
+
+def cache_path(*parts):
+    return os.path.join(CACHE_DIR, *parts)
+
+
+def connect(path, create_tables=None):
+    # One connection per thread and database, tables are created once per
+    # process instead of on every call
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        connections[path] = conn
+
+    with _created_lock:
+        created = path in _created
+    if create_tables is not None and not created:
+        with conn:
+            create_tables(conn)
+        with _created_lock:
+            _created.add(path)
+    return conn
+
+
+def forget(path):
+    # For files deleted or replaced under a running process
+    with _created_lock:
+        _created.discard(path)
+    conn = getattr(_local, "connections", {}).pop(path, None)
+    if conn is not None:
+        conn.close()
@@ -0,0 +1,265 @@
+import os
+import re
+import sys
+import resource
+import time
+import tempfile
+import threading
+import PyPDF2
+import pytesseract
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from pdf2image import convert_from_path, pdfinfo_from_path
+import ocr_cache
+
+OCR_LANG = "eng+guj"
+OCR_DPI = 200
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_MAX_MEMORY_BYTES = int(os.environ.get("OCR_MAX_MEMORY_MB", 1024)) * 1024 * 1024
+MIN_TEXT_LAYER_CHARS = 20
+MIN_TEXT_LAYER_COVERAGE = 0.9
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+class MemoryBudget:
+    # Bytes of page rasters in flight across every iter_pages call in the
+    # process, so concurrent documents share one OCR_MAX_MEMORY_MB
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size, blocking=True):
+        with self.condition:
+            # A page larger than the whole budget still runs, on its own
+            while self.used and self.used + size > self.limit:
+                if not blocking:
+                    return False
+                self.condition.wait()
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+_memory = MemoryBudget(OCR_MAX_MEMORY_BYTES)
+
+
+def _init_worker():
+    # Each worker OCRs one page, so keep tesseract itself single threaded
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = _pool_workers = None
+
+
+def _ocr_page(pdf_path, page_no, lang, dpi):
+    start = time.perf_counter()
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no)
+    text = pytesseract.image_to_string(images[0], lang=lang)
+    return page_no, text, time.perf_counter() - start
+
+
+def _page_raster_bytes(info, dpi):
+    match = re.match(r"([\d.]+) x ([\d.]+) pts", info.get("Page size", ""))
+    width, height = (float(match[1]), float(match[2])) if match else (595.0, 842.0)
+    return int(width / 72 * dpi) * int(height / 72 * dpi) * 3
+
+
+def is_usable_text(text):
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < MIN_TEXT_LAYER_CHARS:
+        return False
+
+    # Legacy (non-Unicode) Gujarati fonts extract as Latin-1 or private use
+    # glyphs, so only Gujarati and plain ASCII count towards coverage
+    valid = sum(1 for c in chars if c.isascii() or "\u0a80" <= c <= "\u0aff")
+    letters = sum(1 for c in chars if c.isalpha())
+    return valid / len(chars) >= MIN_TEXT_LAYER_COVERAGE and letters / len(chars) >= 0.3
+
+
+def _text_layer_pages(pdf_binary):
+    try:
+        reader = PyPDF2.PdfReader(BytesIO(pdf_binary))
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception:
+        return None
+
+
+def iter_pages(
+    pdf_binary,
+    lang=OCR_LANG,
+    dpi=OCR_DPI,
+    workers=OCR_WORKERS,
+    use_cache=True,
+    max_memory=OCR_MAX_MEMORY_BYTES,
+):
+    key = ocr_cache.cache_key(pdf_binary, lang, dpi)
+    page_count, cached = ocr_cache.get_pages(key) if use_cache else (None, {})
+
+    if page_count is not None and len(cached) == page_count:
+        for page_no in range(1, page_count + 1):
+            text, source = cached[page_no]
+            yield {
+                "page_no": page_no,
+                "text": text,
+                "seconds": 0.0,
+                "source": source,
+                "cached": True,
+            }
+        return
+
+    layer = _text_layer_pages(pdf_binary)
+    if layer is not None:
+        page_count = len(layer)
+        needs_ocr = [
+            n
+            for n in range(1, page_count + 1)
+            if n not in cached and not is_usable_text(layer[n - 1])
+        ]
+
+    pdf_path = None
+    pending = {}
+    page_bytes = 0
+    try:
+        if layer is None or needs_ocr:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                f.write(pdf_binary)
+                pdf_path = f.name
+
+            info = pdfinfo_from_path(pdf_path)
+            if layer is None:
+                page_count = info["Pages"]
+                needs_ocr = [n for n in range(1, page_count + 1) if n not in cached]
+
+            # A rasterized page plus tesseract's working copies is roughly 3x
+            # the raw RGB buffer. max_memory caps this call's window, the
+            # shared budget caps all calls together
+            page_bytes = _page_raster_bytes(info, dpi) * 3
+            window = min(max(1, max_memory // page_bytes), workers)
+            pool = _get_pool(workers) if window > 1 else None
+
+        if use_cache:
+            ocr_cache.set_page_count(key, page_count)
+
+        ocr_pages = set(needs_ocr)
+        submitted = 0
+        for page_no in range(1, page_count + 1):
+            if page_no in cached:
+                text, source = cached.pop(page_no)
+                yield {
+                    "page_no": page_no,
+                    "text": text,
+                    "seconds": 0.0,
+                    "source": source,
+                    "cached": True,
+                }
+                continue
+
+            start = time.perf_counter()
+            if page_no not in ocr_pages:
+                text, source = layer[page_no - 1], "text"
+                seconds = time.perf_counter() - start
+            elif pool is None:
+                _memory.acquire(page_bytes)
+                try:
+                    _, text, seconds = _ocr_page(pdf_path, page_no, lang, dpi)
+                finally:
+                    _memory.release(page_bytes)
+                source = "ocr"
+            else:
+                # Only wait for budget when the page needed next isn't
+                # submitted yet, otherwise take what is free right now
+                while len(pending) < window and submitted < len(needs_ocr):
+                    if not _memory.acquire(page_bytes, blocking=page_no not in pending):
+                        break
+                    n = needs_ocr[submitted]
+                    pending[n] = pool.submit(_ocr_page, pdf_path, n, lang, dpi)
+                    submitted += 1
+                try:
+                    _, text, seconds = pending.pop(page_no).result()
+                finally:
+                    _memory.release(page_bytes)
+                source = "ocr"
+
+            if use_cache:
+                ocr_cache.put_page(key, page_no, text, source)
+            yield {
+                "page_no": page_no,
+                "text": text,
+                "seconds": seconds,
+                "source": source,
+                "cached": False,
+            }
+    finally:
+        for future in pending.values():
+            future.cancel()
+            _memory.release(page_bytes)
+        if pdf_path is not None:
+            os.unlink(pdf_path)
+
+    if use_cache:
+        ocr_cache.evict()
+
+
+def extract_pages(pdf_binary, **kwargs):
+    return list(iter_pages(pdf_binary, **kwargs))
+
+
+if __name__ == "__main__":
+    # Usage: python ocr.py [fixture.pdf] [workers]
+    # The default fixture is 12 image-only pages. Longer ones come from
+    # python tests/pdf_fixture.py <out.pdf> <pages>
+    fixture = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "scan.pdf"
+    )
+    with open(fixture, "rb") as f:
+        pdf_binary = f.read()
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else OCR_WORKERS
+
+    timings = {}
+    for n in (1, workers):
+        start = time.perf_counter()
+        per_page = []
+        for page in iter_pages(pdf_binary, workers=n, use_cache=False):
+            per_page.append((page["source"], round(page["seconds"], 2)))
+        timings[n] = time.perf_counter() - start
+        print(f"workers={n}: {timings[n]:.2f}s for {len(per_page)} pages {per_page}")
+
+    print(f"Speedup with {workers} workers: {timings[1] / timings[workers]:.2f}x")
+
+    # Children only show up in RUSAGE_CHILDREN once they have exited and were
+    # waited for, which includes pdftoppm and tesseract under the workers.
+    # ru_maxrss is the largest single child, so the total is an estimate
+    # that assumes every worker peaked at once, not a measured ceiling.
+    # tests/test_ocr.py asserts the measured parent + child peak
+    shutdown_pool()
+    parent_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(
+        f"Peak RSS: parent {parent_rss:.0f} MB, largest child {child_rss:.0f} MB, "
+        f"estimated at most {parent_rss + workers * child_rss:.0f} MB with {workers} workers "
+        f"(budget {OCR_MAX_MEMORY_BYTES // 2**20} MB of page rasters)"
+    )
@@ -0,0 +1,102 @@
+import os
+import time
+import hashlib
+import local_db
+from local_db import CACHE_DIR
+
+OCR_CACHE_PATH = os.path.join(CACHE_DIR, "ocr.sqlite3")
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS pages (
+            key TEXT NOT NULL,
+            page_no INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'ocr',
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (key, page_no)
+        )"""
+    )
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(pages)")]
+    if "source" not in columns:
+        conn.execute("ALTER TABLE pages ADD COLUMN source TEXT NOT NULL DEFAULT 'ocr'")
+    conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, page_count INTEGER NOT NULL)"
+    )
+
+
+def _connect():
+    return local_db.connect(OCR_CACHE_PATH, _create_tables)
+
+
+def cache_key(pdf_binary, lang, dpi):
+    return f"{hashlib.sha256(pdf_binary).hexdigest()}:{lang}:{dpi}"
+
+
+def get_pages(key):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT page_count FROM documents WHERE key = ?", (key,)
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT page_no, text, source FROM pages WHERE key = ?", (key,)
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE pages SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+
+    page_count = row[0] if row else None
+    return page_count, {page_no: (text, source) for page_no, text, source in rows}
+
+
+def set_page_count(key, page_count):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (key, page_count) VALUES (?, ?)",
+            (key, page_count),
+        )
+
+
+def put_page(key, page_no, text, source="ocr"):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO pages (key, page_no, text, source, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, page_no, text, source, len(text.encode("utf-8")), time.time()),
+        )
+
+
+def source_stats():
+    with _connect() as conn:
+        return dict(
+            conn.execute("SELECT source, COUNT(*) FROM pages GROUP BY source").fetchall()
+        )
+
+
+def evict(max_bytes=OCR_CACHE_MAX_BYTES):
+    with _connect() as conn:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+
+        evicted = 0
+        rows = conn.execute(
+            "SELECT key, page_no, size FROM pages ORDER BY last_used"
+        ).fetchall()
+        for key, page_no, size in rows:
+            if total <= max_bytes:
+                break
+            conn.execute(
+                "DELETE FROM pages WHERE key = ? AND page_no = ?", (key, page_no)
+            )
+            total -= size
+            evicted += 1
+
+        conn.execute(
+            "DELETE FROM documents WHERE key NOT IN (SELECT DISTINCT key FROM pages)"
+        )
+    return evicted
@@ -0,0 +1,205 @@
+import re
+import time
+import argparse
+import statistics
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+TEXT_FILTERS = ["gr_no", "branch", "subject_en", "subject_gu"]
+GUJARATI_DIGITS = str.maketrans("૦૧૨૩૪૫૬૭૮૯", "0123456789")
+MONTHS = {
+    name: number
+    for number in range(1, 13)
+    for name in (
+        date(2000, number, 1).strftime("%b").lower(),
+        date(2000, number, 1).strftime("%B").lower(),
+    )
+}
+
+
+# The prompt generate_query_with_llm sent before filters were compiled, kept
+# so the benchmark measures the round trip it replaced
+_LLM_BASELINE_PROMPT = """You are an assistant that generates Supabase queries in Python.
+You must only generate queries that read data.
+Do not generate any other types of queries like INSERT, UPDATE, or DELETE.
+- Example:
+  Input: {"gr_no": "1234", "date": "2024-01", "branch": "Finance"}
+  Output:
+  query = supabase.table("documents").select(COLUMNS, count="exact").ilike("gr_no", "%1234%").gte("date", "2024-01-01").lt("date", "2024-02-01").ilike("branch", "%Finance%")
+- Always select `COLUMNS` with `count="exact"` exactly as in the example, `COLUMNS` is a variable.
+- If filtering by "date", always use `gte("date", "YYYY-MM-DD")` and `lt("date", "YYYY-MM-DD")` for the end of the month.
+- If filtering by "gr_no", "branch", "subject_en" and "subject_gu", always use `ilike("gr_no", "%search_term%")`, `ilike("branch", "%search_term")`, `ilike("subject_en", "%search_term%")` and `ilike("subject_gu", "%search_term%")`.
+Return only the Python code for the SELECT query (no explanations).
+"""
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _financial_year(start_year, end):
+    # Indian financial years run from 1 April to 31 March, 2016-17 or 2016-2017
+    if int(end) != (start_year + 1) % 10 ** len(end):
+        return None
+    return date(start_year, 4, 1), date(start_year + 1, 4, 1)
+
+
+def parse_date_range(value):
+    text = value.translate(GUJARATI_DIGITS).strip().lower().replace(",", " ")
+
+    if re.fullmatch(r"\d{4}", text):
+        year = int(text)
+        return date(year, 1, 1), date(year + 1, 1, 1)
+
+    for pattern in (
+        "%Y-%m-%d",
+        "%d/%m/%Y",
+        "%d-%m-%Y",
+        "%d.%m.%Y",
+        "%d %b %Y",
+        "%d %B %Y",
+        "%d-%b-%Y",
+    ):
+        try:
+            day = datetime.strptime(text, pattern).date()
+            return day, day + timedelta(days=1)
+        except ValueError:
+            pass
+
+    # "fy 2011-12" is always a financial year, a bare 2011-12 is December 2011
+    match = re.fullmatch(r"(fy\s*)?(\d{4})[-/](\d{2}|\d{4})", text)
+    if match and (match[1] or len(match[3]) == 4 or not 1 <= int(match[3]) <= 12):
+        year_range = _financial_year(int(match[2]), match[3])
+        if year_range is None:
+            raise ValueError(
+                f"Unrecognized date: {value}, a financial year spans two "
+                f"consecutive years, e.g. {match[2]}-{(int(match[2]) + 1) % 100:02}"
+            )
+        return year_range
+
+    match = re.fullmatch(r"(\d{4})[-/](\d{1,2})|(\d{1,2})[-/](\d{4})", text)
+    if match:
+        year = int(match[1] or match[4])
+        month = int(match[2] or match[3])
+        if not 1 <= month <= 12:
+            raise ValueError(f"Unrecognized date: {value}, month must be in 1..12")
+        start = date(year, month, 1)
+        return start, _next_month(start)
+
+    match = re.fullmatch(r"([a-z]+)\s+(\d{4})", text)
+    if match and match[1] in MONTHS:
+        start = date(int(match[2]), MONTHS[match[1]], 1)
+        return start, _next_month(start)
+
+    raise ValueError(f"Unrecognized date: {value}")
+
+
+def _like_pattern(term):
+    escaped = term.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@lru_cache(maxsize=1024)
+def _compile(items):
+    input = dict(items)
+    plan = []
+
+    for column in TEXT_FILTERS:
+        if input.get(column):
+            plan.append(("ilike", column, _like_pattern(input[column])))
+
+    if input.get("date"):
+        start, end = parse_date_range(input["date"])
+        plan.append(("gte", "date", start.isoformat()))
+        plan.append(("lt", "date", end.isoformat()))
+    else:
+        if input.get("from_date"):
+            start, _ = parse_date_range(input["from_date"])
+            plan.append(("gte", "date", start.isoformat()))
+        if input.get("to_date"):
+            _, end = parse_date_range(input["to_date"])
+            plan.append(("lt", "date", end.isoformat()))
+
+    return tuple(plan)
+
+
+def compile_filters(input):
+    fields = TEXT_FILTERS + ["date", "from_date", "to_date"]
+    return _compile(tuple((field, str(input[field])) for field in fields if input.get(field)))
+
+
+def apply_filters(query, plan):
+    for method, column, value in plan:
+        query = getattr(query, method)(column, value)
+    return query
+
+
+def describe(plan):
+    return "".join(f'.{method}("{column}", "{value}")' for method, column, value in plan)
+
+
+def _llm_baseline(inputs, samples):
+    from openai import OpenAI
+
+    client = OpenAI()
+    timings = []
+    for n in range(samples):
+        start = time.perf_counter()
+        client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": _LLM_BASELINE_PROMPT},
+                {
+                    "role": "user",
+                    "content": f"Generate a Supabase query for this input: {inputs[n % len(inputs)]}",
+                },
+            ],
+            temperature=0,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark filter compilation")
+    parser.add_argument("iterations", nargs="?", type=int, default=10000)
+    parser.add_argument(
+        "--llm",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also time N gpt-4o-mini round trips of the replaced LLM path",
+    )
+    args = parser.parse_args()
+    inputs = [
+        {"gr_no": "1234", "date": "2024-01", "branch": "K-(Budget)"},
+        {"date": "Jan 2019", "subject_en": "bonus"},
+        {"from_date": "2023-01-01", "to_date": "2023-12-31", "branch": "P-(Pension)"},
+        {"gr_no": "જનવ-૧૦૨૦૧૪-૪૭૩૯૦૨-(૨)-અ", "date": "12/06/2005"},
+        {"date": "2016-17", "subject_en": "pay"},
+    ]
+
+    start = time.perf_counter()
+    for input in inputs:
+        _compile.cache_clear()
+        compile_filters(input)
+    cold = (time.perf_counter() - start) / len(inputs)
+
+    start = time.perf_counter()
+    for n in range(args.iterations):
+        compile_filters(inputs[n % len(inputs)])
+    warm = (time.perf_counter() - start) / args.iterations
+
+    for input in inputs:
+        print(f"{input} -> {describe(compile_filters(input))}")
+    print(f"cold compile: {cold * 1e6:.1f}us, memoized: {warm * 1e6:.2f}us per query")
+    if args.llm:
+        timings = _llm_baseline(inputs, args.llm)
+        median = statistics.median(timings)
+        print(
+            f"LLM query generation: median {median * 1e3:.0f}ms, max "
+            f"{max(timings) * 1e3:.0f}ms over {len(timings)} calls "
+            f"({median / cold:.0f}x a cold compile)"
+        )
+    else:
+        print("LLM query generation not measured, pass --llm N (needs OPENAI_API_KEY)")
@@ -3,82 +3,326 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import Counter
 from supabase import create_client
 from openai import OpenAI
-import httpx
-from pdf2image import convert_from_bytes
-import pytesseract
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import index_state
+import downloader
+from ocr import iter_pages
+from query_compiler import compile_filters, apply_filters
+from ocr import OCR_LANG, OCR_DPI
+from vector_store import split_text, embed_in_batches, insert_chunks, delete_chunks
+from vector_store import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS, EMBEDDING_MODEL
+from vector_store import VECTOR_SEARCH
 
 openai = OpenAI()
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 supabase = create_client(url, key)
 
-urls = [
-    "https://financedepartment.gujarat.gov.in/Documents/A_2424_01-Jul-2010_737.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/A_2851_26-Sep-2024_956.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/CH_2558_02-May-2022_993.PDF",
-    "https://financedepartment.gujarat.gov.in/Documents/CH_143_28-May-2004_874.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/CH_1820_01-Jan-2007_858.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/CH_61_07-Feb-2011_121.PDF",
-    "https://financedepartment.gujarat.gov.in/Documents/M_411_03-Oct-2000_9.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/K_2858_23-Jan-2025_134.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/T_2822_24-May-2024_347.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/CH_2821_04-Jul-2024_596.PDF",
-    "https://financedepartment.gujarat.gov.in/Documents/P_2575_29-Jul-2022_248.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/A_2376_11-Jun-2020_786.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/DMO_2394_19-Oct-2020_439.pdf",
-    "https://financedepartment.gujarat.gov.in/Documents/P_2214_26-Dec-2018_705.PDF",
-    "https://financedepartment.gujarat.gov.in/Documents/Z_2220_13-Feb-2019_629.PDF",
-    "https://financedepartment.gujarat.gov.in/Documents/P_2222_27-Feb-2019_876.PDF",
-]
-
-for url in urls:
-    print(f"Processing {url}")
-    with httpx.Client() as client:
-        response = client.get(url)
-        response.raise_for_status()
-
-    pdf_binary = response.content
-    images = convert_from_bytes(pdf_binary)
-
-    print("Extracting text...")
-    text = ""
-    for img in images:
-        page_text = pytesseract.image_to_string(img, lang="eng+guj")
-        text += page_text + "\n"
-
-    print("Splitting text...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-        length_function=len,
-        is_separator_regex=False,
-        separators=["\n\n", "\n", "."],
+if VECTOR_SEARCH == "local":
+    import vector_index
+
+QUEUE_SIZE = 4
+SELECT_PAGE_SIZE = 1000
+STAGE_WORKERS = {
+    "download": 4,
+    "extract": 2,
+    "chunk": 1,
+    "embed": 2,
+    "store": 2,
+}
+
+# Changing any of these makes every document count as changed
+INDEX_CONFIG_HASH = hashlib.sha256(
+    repr(
+        (CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS, EMBEDDING_MODEL, OCR_LANG, OCR_DPI)
+    ).encode()
+).hexdigest()[:16]
+
+_DONE = object()
+
+
+def select_documents(filters, doc_ids=None, limit=None):
+    plan = compile_filters(filters)
+    offset = 0
+    selected = 0
+
+    while limit is None or selected < limit:
+        query = supabase.table("documents").select("id, pdf_url")
+        if doc_ids:
+            query = query.in_("id", doc_ids)
+        query = apply_filters(query, plan).not_.is_("pdf_url", "null").order("id")
+        rows = query.range(offset, offset + SELECT_PAGE_SIZE - 1).execute().data
+        if not rows:
+            return
+
+        for row in rows:
+            yield row
+            selected += 1
+            if limit is not None and selected >= limit:
+                return
+        offset += SELECT_PAGE_SIZE
+
+
+def dry_run_change(doc, state):
+    # The report needs no bodies: new and outdated documents are known from
+    # the local state, the rest are asked with a conditional request
+    if state is None:
+        return "new"
+    if state["config_hash"] != INDEX_CONFIG_HASH:
+        return "config"
+    if downloader.is_modified(doc["pdf_url"], state["etag"], state["last_modified"]):
+        return "changed"
+    return "unchanged"
+
+
+def download(doc, force=False, dry_run=False):
+    state = None if force else index_state.get_document_state(doc["id"])
+    if dry_run:
+        doc["change"] = dry_run_change(doc, state)
+        return None
+
+    # A stored copy is revalidated with a conditional request, so unchanged
+    # PDFs cost a 304 and new ones cross the network once for every tool
+    blob = downloader.download(doc["pdf_url"], revalidate=True, force=force)
+
+    doc["etag"] = blob["etag"]
+    doc["last_modified"] = blob["last_modified"]
+    doc["content_hash"] = blob["sha256"]
+
+    if state is None:
+        doc["change"] = "new"
+    elif state["config_hash"] != INDEX_CONFIG_HASH:
+        doc["change"] = "config"
+    elif state["content_hash"] != doc["content_hash"]:
+        doc["change"] = "changed"
+    else:
+        doc["change"] = "unchanged"
+        index_state.update_validators(doc["id"], doc["etag"], doc["last_modified"])
+        index_state.set_stage(doc["id"], doc["pdf_url"], "store", len(state["chunk_hashes"]))
+        return None
+
+    # Chunks are only diffed against a previous index built with this config
+    changed = doc["change"] == "changed"
+    doc["old_chunk_hashes"] = state["chunk_hashes"] if changed else None
+    doc["pdf_path"] = blob["path"]
+    return doc
+
+
+def extract(doc):
+    with open(doc.pop("pdf_path"), "rb") as f:
+        pages = list(iter_pages(f.read()))
+    doc["text"] = "\n".join(page["text"] for page in pages)
+    doc["ocr_pages"] = sum(1 for page in pages if page["source"] == "ocr")
+    return doc
+
+
+def chunk(doc):
+    doc["chunks"] = split_text(doc.pop("text"))
+    doc["chunk_hashes"] = [
+        hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in doc["chunks"]
+    ]
+
+    old = doc["old_chunk_hashes"]
+    if old is None:
+        doc["changed"] = list(range(len(doc["chunks"])))
+        doc["removed"] = None
+    else:
+        doc["changed"] = [
+            i
+            for i, chunk_hash in enumerate(doc["chunk_hashes"])
+            if i >= len(old) or old[i] != chunk_hash
+        ]
+        doc["removed"] = list(range(len(doc["chunks"]) + 1, len(old) + 1))
+    return doc
+
+
+def embed(doc):
+    chunks = [doc["chunks"][i] for i in doc["changed"]]
+    doc["embeddings"] = embed_in_batches(openai, chunks)
+    return doc
+
+
+def store(doc):
+    chunk_nos = [i + 1 for i in doc["changed"]]
+    if doc["removed"] is None:
+        # Nothing to diff against (new document, new config or rows left by
+        # an interrupted run), so the document's vectors are replaced whole
+        delete_chunks(supabase, doc["id"])
+    else:
+        delete_chunks(supabase, doc["id"], chunk_nos + doc["removed"])
+
+    if VECTOR_SEARCH == "local":
+        removed = None if doc["removed"] is None else chunk_nos + doc["removed"]
+        vector_index.get_index().remove(doc["id"], removed)
+
+    chunks = [doc["chunks"][i] for i in doc["changed"]]
+    insert_chunks(supabase, doc["id"], chunks, doc["embeddings"], chunk_nos)
+    index_state.put_document_state(
+        doc["id"],
+        doc["pdf_url"],
+        doc["etag"],
+        doc["last_modified"],
+        doc["content_hash"],
+        INDEX_CONFIG_HASH,
+        doc["chunk_hashes"],
     )
-    chunks = text_splitter.split_text(text)
-    print(f"Extracted {len(chunks)} chunks")
+    return doc
+
+
+def run_stage(name, fn, inbox, outbox, stats, checkpoint=True):
+    def work():
+        while True:
+            doc = inbox.get()
+            if doc is _DONE:
+                inbox.put(_DONE)
+                return
+            try:
+                result = fn(doc)
+            except Exception as e:
+                print(f"[{name}] {doc['pdf_url']} failed: {e}")
+                if checkpoint:
+                    index_state.set_stage(
+                        doc["id"], doc["pdf_url"], "failed", error=str(e)
+                    )
+                with stats["lock"]:
+                    stats["failed"] += 1
+                continue
+            if result is None:
+                continue
+
+            chunks = len(doc["chunks"]) if "chunks" in doc else None
+            index_state.set_stage(doc["id"], doc["pdf_url"], name, chunks)
+            if outbox is not None:
+                outbox.put(doc)
+            else:
+                with stats["lock"]:
+                    stats["stored"] += 1
+                    stats["chunks"] += len(doc["changed"])
+                    stats["reused_chunks"] += len(doc["chunks"]) - len(doc["changed"])
+                print(
+                    f"Stored {len(doc['changed'])} of {len(doc['chunks'])} chunks "
+                    f"for {doc['pdf_url']} ({doc['change']})"
+                )
+
+    def close():
+        for worker in workers:
+            worker.join()
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    workers = [
+        threading.Thread(target=work, daemon=True) for _ in range(STAGE_WORKERS[name])
+    ]
+    for worker in workers:
+        worker.start()
+    closer = threading.Thread(target=close, daemon=True)
+    closer.start()
+    return closer
+
+
+def run_pipeline(documents, force=False, dry_run=False):
+    stats = {
+        "lock": threading.Lock(),
+        "changes": Counter(),
+        "stored": 0,
+        "failed": 0,
+        "chunks": 0,
+        "reused_chunks": 0,
+    }
 
-    query = supabase.table("documents").select("*").eq("pdf_url", url).execute()
-    print(query)
+    def check(doc):
+        result = download(doc, force, dry_run)
+        with stats["lock"]:
+            stats["changes"][doc["change"]] += 1
+        return result
 
-    doc_id = query.data[0]["id"]
-    print(f"Document ID: {doc_id}")
+    stages = [
+        ("download", check),
+        ("extract", extract),
+        ("chunk", chunk),
+        ("embed", embed),
+        ("store", store),
+    ]
+    queues = [queue.Queue(maxsize=QUEUE_SIZE) for _ in stages]
 
-    for chunk_number, chunk in enumerate(chunks, start=1):
-        embedding_response = openai.embeddings.create(
-            model="text-embedding-3-small", input=chunk
+    closers = []
+    for i, (name, fn) in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        closers.append(run_stage(name, fn, queues[i], outbox, stats, not dry_run))
+
+    start = time.perf_counter()
+    for doc in documents:
+        queues[0].put(doc)
+    queues[0].put(_DONE)
+
+    for closer in closers:
+        closer.join()
+    seconds = time.perf_counter() - start
+
+    if VECTOR_SEARCH == "local" and not dry_run:
+        added, removed = vector_index.get_index().sync(supabase)
+        print(
+            f"Added {added} chunks to the local vector index, "
+            f"removed {removed} deleted upstream"
         )
-        embedding = embedding_response.data[0].embedding
 
-        data = {
-            "doc_id": doc_id,
-            "chunk_no": chunk_number,
-            "body": chunk,
-            "embedding": embedding,
-        }
+    changes = stats["changes"]
+    to_index = changes["new"] + changes["changed"] + changes["config"]
+    if dry_run:
+        print(
+            f"Dry run: {to_index} of {sum(changes.values())} documents would be "
+            f"re-indexed ({changes['new']} new, {changes['changed']} modified on the server, "
+            f"{changes['config']} with an outdated config), "
+            f"{changes['unchanged']} unchanged, {stats['failed']} failed"
+        )
+        # Where earlier runs left each document, the last stage it finished
+        checkpoints = index_state.stage_counts()
+        stored = checkpoints.pop("store", 0)
+        failed = checkpoints.pop("failed", 0)
+        stopped = ", ".join(f"{count} after {stage}" for stage, count in checkpoints.items())
+        print(
+            f"Checkpoints: {stored} indexed, {failed} failed in their last run"
+            + (f", interrupted: {stopped}" if stopped else "")
+        )
+        return stats
 
-        supabase.table("vectors").insert(data).execute()
+    print(
+        f"Stored {stats['stored']} documents ({stats['chunks']} chunks embedded, "
+        f"{stats['reused_chunks']} unchanged), {changes['unchanged']} skipped, "
+        f"{stats['failed']} failed in {seconds:.1f}s "
+        f"({stats['chunks'] / seconds if seconds else 0:.1f} chunks/s)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Index documents into the vectors table"
+    )
+    parser.add_argument("--branch")
+    parser.add_argument("--from-date")
+    parser.add_argument("--to-date")
+    parser.add_argument("--doc-id", type=int, action="append")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument(
+        "--force", action="store_true", help="Re-index documents even if unchanged"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would be re-indexed"
+    )
+    args = parser.parse_args()
 
-    print(f"Processed and inserted {len(chunks)} chunks for {url}")
+    filters = {
+        "branch": args.branch,
+        "from_date": args.from_date,
+        "to_date": args.to_date,
+    }
+    documents = select_documents(filters, args.doc_id, args.limit)
+    run_pipeline(documents, args.force, args.dry_run)
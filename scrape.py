@@ -1,8 +1,22 @@
 import os
+import time
+import queue
+import argparse
+import threading
 from dotenv import load_dotenv
-from deep_translator import GoogleTranslator
-from bs4 import BeautifulSoup
 from supabase import create_client
+import corpus_stats
+import scrape_state
+from gr_pages import (
+    parse_branches,
+    parse_table,
+    iter_branch_rows_http,
+    save_fixtures,
+    load_fixtures,
+    compare_with_fixtures,
+)
+from translation import Translator
+from query_compiler import parse_date_range
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -15,6 +29,21 @@ url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 supabase = create_client(url, key)
 
+BASE_URL = "https://financedepartment.gujarat.gov.in/gr.html"
+# The branch table endpoint behind the jqTransform dropdown is not documented,
+# {value} and {name} are filled from the <option> of each branch
+BRANCH_URL = os.environ.get("SCRAPE_BRANCH_URL", BASE_URL + "?branch={value}")
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", 4))
+# Minimum gap between two requests to the site, across all threads
+SCRAPE_DELAY = float(os.environ.get("SCRAPE_DELAY", 0.5))
+# Branches parsed ahead of translation and inserts
+SCRAPE_PREFETCH = 4
+SCRAPE_BATCH_SIZE = int(os.environ.get("SCRAPE_BATCH_SIZE", 200))
+# Natural key of a GR, documents needs a unique constraint on these columns
+CONFLICT_COLUMNS = "gr_no,branch"
+COMPARED_COLUMNS = ("date", "subject_en", "subject_gu", "pdf_url")
+EXISTING_LOOKUP_SIZE = 100
+
 
 def click_dropdown_menu(driver):
     dropdown_menu = WebDriverWait(driver, 10).until(
@@ -31,9 +60,7 @@ def get_ul_element(driver):
     )
 
 
-def scrape(base_url):
-    print("Scraping...")
-
+def iter_branches_selenium(base_url):
     chrome_web_driver_path = "./chromedriver"
     options = webdriver.ChromeOptions()
 
@@ -73,65 +100,267 @@ def scrape(base_url):
                 EC.element_to_be_clickable(li_elements[i])
             ).click()
 
-            print(f"Extracting data for {branch}...")
-
             table = WebDriverWait(driver, 10).until(
                 EC.presence_of_element_located((By.CLASS_NAME, "table"))
             )
-            soup = BeautifulSoup(table.get_attribute("outerHTML"), "html.parser")
-
-            extracted_data = []
-            print(f"{len(soup.find_all('tr'))} records are there in {branch}")
-            for row in soup.find_all("tr"):
-                cols = row.find_all("td")
-                if len(cols) == 4:
-                    gr_no = cols[0].text.strip()
-                    date = cols[1].text.strip()
-                    subject = cols[2].text.strip()
-                    pdf_link = cols[3].find("a")["href"] if cols[3].find("a") else None
-
-                    subject_en = GoogleTranslator(source="auto", target="en").translate(
-                        subject
-                    )
-                    subject_gu = GoogleTranslator(source="auto", target="gu").translate(
-                        subject
-                    )
-
-                    pdf_url = (
-                        f"https://financedepartment.gujarat.gov.in/{pdf_link}"
-                        if pdf_link
-                        else None
-                    )
-                    extracted_data.append(
-                        {
-                            "gr_no": gr_no,
-                            "date": date,
-                            "branch": branch,
-                            "subject_en": subject_en,
-                            "subject_gu": subject_gu,
-                            "pdf_url": pdf_url,
-                        }
-                    )
-                    print(
-                        f"Extracted data for {gr_no} currently at {len(extracted_data)}"
-                    )
-                    if len(extracted_data) == 25:
-                        supabase.table("documents").insert(extracted_data).execute()
-                        print(f"Inserted {len(extracted_data)} records for {branch}")
-                        print("Resetting extracted_data")
-                        extracted_data = []
-
-            if extracted_data:
-                supabase.table("documents").insert(extracted_data).execute()
-                print(f"Inserted {len(extracted_data)} records for {branch}")
+            yield branch, table.get_attribute("outerHTML")
+    finally:
+        driver.quit()
+        print("Driver closed")
+
+
+def iter_branch_rows(base_url, mode="auto"):
+    # The HTTP endpoint is a guess until --confirm-http matched it against a
+    # saved Selenium crawl, auto keeps using Selenium before that
+    if mode == "auto" and not scrape_state.is_confirmed(BRANCH_URL):
+        mode = "selenium"
+    if mode in ("auto", "http"):
+        try:
+            yield from iter_branch_rows_http(
+                base_url, BRANCH_URL, concurrency=SCRAPE_CONCURRENCY, delay=SCRAPE_DELAY
+            )
+            return
+        except Exception as e:
+            if mode == "http":
+                raise
+            # Branches already handed out are upserted again, which is harmless
+            print(f"HTTP scraping failed ({e}), falling back to Selenium")
+
+    for branch, html in iter_branches_selenium(base_url):
+        yield branch, parse_table(html, branch) or []
+
+
+def prefetch(iterable, size=SCRAPE_PREFETCH):
+    # Runs the scraping generator on its own thread so fetching and parsing
+    # carry on while the caller translates and inserts
+    items = queue.Queue(maxsize=size)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def parse_gr_date(value):
+    try:
+        return parse_date_range(value)[0]
+    except ValueError:
+        return None
+
+
+def rows_since(rows, mark):
+    # Rows newer than the branch's high-water mark. Tables list the newest GR
+    # first, so once the mark is reached the rest of the table is known
+    if mark is None:
+        return rows
+    mark_date, mark_gr_no = parse_gr_date(mark[0]), mark[1]
+    dates = [parse_gr_date(row["date"]) for row in rows]
+    known = [d for d in dates if d is not None]
+    gr_nos = [row["gr_no"] for row in rows]
+    if mark_date is None or not known:
+        # Without dates only the position of the marked GR tells what is new
+        return rows[: gr_nos.index(mark_gr_no)] if mark_gr_no in gr_nos else rows
+    newest_first = all(a >= b for a, b in zip(known, known[1:]))
+
+    fresh = []
+    above_mark = True
+    for row, day in zip(rows, dates):
+        if row["gr_no"] == mark_gr_no:
+            above_mark = False
+        if day is None:
+            # An undated row is only new if it is listed above the marked GR
+            if above_mark:
+                fresh.append(row)
+        elif day > mark_date:
+            fresh.append(row)
+        elif day == mark_date and row["gr_no"] != mark_gr_no:
+            fresh.append(row)
+        elif newest_first:
+            break
+    return fresh
+
+
+def unique(rows):
+    # One upsert can't touch the same key twice, keep a GR's first listing
+    seen = set()
+    result = []
+    for row in rows:
+        if row["gr_no"] not in seen:
+            seen.add(row["gr_no"])
+            result.append(row)
+    return result
+
+
+def newest(rows):
+    dated = [(parse_gr_date(row["date"]), -i, row) for i, row in enumerate(rows)]
+    dated = [item for item in dated if item[0] is not None]
+    if dated:
+        return max(dated, key=lambda item: item[:2])[2]
+    # No parseable dates, the first listed GR marks the position instead
+    return rows[0] if rows else None
+
+
+def fetch_existing(branch, gr_nos):
+    existing = {}
+    for start in range(0, len(gr_nos), EXISTING_LOOKUP_SIZE):
+        rows = (
+            supabase.table("documents")
+            .select("gr_no, " + ", ".join(COMPARED_COLUMNS))
+            .eq("branch", branch)
+            .in_("gr_no", gr_nos[start : start + EXISTING_LOOKUP_SIZE])
+            .execute()
+            .data
+        )
+        existing.update((row["gr_no"], row) for row in rows)
+    return existing
+
+
+def is_changed(row, old):
+    for column in COMPARED_COLUMNS:
+        if column == "date":
+            if parse_gr_date(row["date"] or "") != parse_gr_date(str(old["date"] or "")):
+                return True
+        elif (row[column] or None) != (old[column] or None):
+            return True
+    return False
+
+
+def upsert_rows(rows, batch_size=SCRAPE_BATCH_SIZE):
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        supabase.table("documents").upsert(batch, on_conflict=CONFLICT_COLUMNS).execute()
+
+
+def scrape(
+    base_url, mode="auto", translator=None, incremental=True, batch_size=SCRAPE_BATCH_SIZE
+):
+    print("Scraping...")
+    translator = translator or Translator()
+    totals = {"new": 0, "changed": 0, "skipped": 0}
+
+    try:
+        for branch, rows in prefetch(iter_branch_rows(base_url, mode)):
+            print(f"{len(rows)} records are there in {branch}")
+            if rows and all(parse_gr_date(row["date"]) is None for row in rows):
+                print(
+                    f"{branch}: no parseable dates (e.g. {rows[0]['date']!r}), "
+                    f"new rows are found by their position above the last marked GR"
+                )
+            mark = scrape_state.get_mark(branch) if incremental else None
+            fresh = unique(rows_since(rows, mark))
+            skipped = len(rows) - len(fresh)
+
+            translator.translate_rows(fresh)
+            existing = fetch_existing(branch, [row["gr_no"] for row in fresh])
+            new = [row for row in fresh if row["gr_no"] not in existing]
+            changed = [
+                row
+                for row in fresh
+                if row["gr_no"] in existing and is_changed(row, existing[row["gr_no"]])
+            ]
+            skipped += len(fresh) - len(new) - len(changed)
+
+            upsert_rows(new + changed, batch_size)
+            latest = newest(rows)
+            if latest is not None:
+                scrape_state.put_mark(branch, latest["date"], latest["gr_no"])
+
+            totals["new"] += len(new)
+            totals["changed"] += len(changed)
+            totals["skipped"] += skipped
+            print(f"{branch}: {len(new)} new, {len(changed)} changed, {skipped} skipped")
 
     except Exception as e:
         print(f"Error: {e}")
 
     finally:
-        driver.quit()
-        print("Driver closed")
+        corpus_stats.invalidate()
+        print(
+            f"Total: {totals['new']} new, {totals['changed']} changed, "
+            f"{totals['skipped']} skipped"
+        )
+        print(f"Translation: {translator.stats}")
+
+
+def benchmark(base_url, modes=("http", "selenium")):
+    # Fetching and parsing only, no translation and no inserts
+    for mode in modes:
+        start = time.perf_counter()
+        rows = sum(len(rows) for _, rows in iter_branch_rows(base_url, mode))
+        seconds = time.perf_counter() - start
+        print(f"{mode:8} {rows} rows in {seconds:.1f}s ({rows / seconds:.1f} rows/s)")
+
+
+def confirm_http(base_url, directory):
+    # Crawls over HTTP and checks every branch against a saved Selenium crawl,
+    # only a clean match lets auto mode use the endpoint
+    fixtures = load_fixtures(directory)
+    fetched = dict(
+        iter_branch_rows_http(
+            base_url, BRANCH_URL, concurrency=SCRAPE_CONCURRENCY, delay=SCRAPE_DELAY
+        )
+    )
+    problems = compare_with_fixtures(fixtures, fetched)
+    for problem in problems:
+        print(problem)
+    if problems:
+        print(f"{BRANCH_URL} does not match {directory}, auto mode keeps using Selenium")
+        return False
+    scrape_state.confirm(BRANCH_URL)
+    print(f"{BRANCH_URL} matches {len(fixtures)} saved branches, auto mode will use it")
+    return True
 
 
 if __name__ == "__main__":
-    scrape("https://financedepartment.gujarat.gov.in/gr.html")
+    parser = argparse.ArgumentParser(description="Scrape GRs into the documents table")
+    parser.add_argument("--mode", choices=["auto", "http", "selenium"], default="auto")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="Compare rows/s of both modes"
+    )
+    parser.add_argument(
+        "--fixture", nargs="+", help="Parse saved gr.html / branch pages and print rows"
+    )
+    parser.add_argument(
+        "--save-fixtures", metavar="DIR", help="Save every branch table from Selenium"
+    )
+    parser.add_argument(
+        "--confirm-http",
+        metavar="DIR",
+        help="Check the HTTP endpoint against tables saved with --save-fixtures",
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Ignore high-water marks, re-check every row"
+    )
+    parser.add_argument("--batch-size", type=int, default=SCRAPE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.fixture:
+        for path in args.fixture:
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+            print(f"{path}: branches {parse_branches(html)}")
+            for row in parse_table(html, os.path.basename(path)) or []:
+                print(row)
+    elif args.save_fixtures:
+        saved = save_fixtures(args.save_fixtures, iter_branches_selenium(BASE_URL))
+        print(f"Saved {saved} branch tables to {args.save_fixtures}")
+    elif args.confirm_http:
+        confirm_http(BASE_URL, args.confirm_http)
+    elif args.benchmark:
+        benchmark(BASE_URL)
+    else:
+        scrape(BASE_URL, args.mode, incremental=not args.full, batch_size=args.batch_size)
@@ -0,0 +1,66 @@
+import os
+import time
+import local_db
+from local_db import CACHE_DIR
+
+SCRAPE_STATE_PATH = os.path.join(CACHE_DIR, "scrape_state.sqlite3")
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS high_water_marks (
+            branch TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            gr_no TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS confirmed_urls (
+            url TEXT PRIMARY KEY,
+            confirmed_at REAL NOT NULL
+        )"""
+    )
+
+
+def _connect():
+    return local_db.connect(SCRAPE_STATE_PATH, _create_tables)
+
+
+def get_mark(branch):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT date, gr_no FROM high_water_marks WHERE branch = ?", (branch,)
+        ).fetchone()
+    return row
+
+
+def put_mark(branch, date, gr_no):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO high_water_marks (branch, date, gr_no, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (branch, date, gr_no, time.time()),
+        )
+
+
+def reset(branch=None):
+    with _connect() as conn:
+        if branch is None:
+            conn.execute("DELETE FROM high_water_marks")
+        else:
+            conn.execute("DELETE FROM high_water_marks WHERE branch = ?", (branch,))
+
+
+def is_confirmed(url):
+    with _connect() as conn:
+        row = conn.execute("SELECT 1 FROM confirmed_urls WHERE url = ?", (url,)).fetchone()
+    return row is not None
+
+
+def confirm(url):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO confirmed_urls (url, confirmed_at) VALUES (?, ?)",
+            (url, time.time()),
+        )
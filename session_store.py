@@ -0,0 +1,142 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import threading
+from collections import OrderedDict
+import local_db
+
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "chat_sessions.sqlite3")
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 64))
+JSON_FILE_PATTERN = re.compile(r"chat_(?P<user_id>.+)_(?P<session_id>session_.+)\.json$")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS messages_session ON messages (user_id, session_id, id)"
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS rolling_summaries (
+            user_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (user_id, session_id)
+        )"""
+    )
+
+
+def _connect():
+    return local_db.connect(SESSION_DB_PATH, _create_tables)
+
+
+def append_message(user_id, session_id, message):
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO messages (user_id, session_id, message, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, session_id, json.dumps(message), time.time()),
+        )
+
+
+def append_messages(user_id, session_id, messages):
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, session_id, message, created_at) VALUES (?, ?, ?, ?)",
+            [(user_id, session_id, json.dumps(m), now) for m in messages],
+        )
+
+
+def get_messages(user_id, session_id):
+    key = (user_id, session_id)
+    with _cache_lock:
+        last_id, messages = _cache.pop(key, (0, []))
+
+    # Only rows written since the last read are fetched, including rows
+    # appended by other processes or tabs
+    rows = (
+        _connect()
+        .execute(
+            "SELECT id, message FROM messages WHERE user_id = ? AND session_id = ? AND id > ? ORDER BY id",
+            (user_id, session_id, last_id),
+        )
+        .fetchall()
+    )
+    if rows:
+        messages = messages + [json.loads(message) for _, message in rows]
+        last_id = rows[-1][0]
+
+    with _cache_lock:
+        _cache[key] = (last_id, messages)
+        while len(_cache) > SESSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return list(messages)
+
+
+def get_rolling_summary(user_id, session_id):
+    row = (
+        _connect()
+        .execute(
+            "SELECT message_count, summary FROM rolling_summaries WHERE user_id = ? AND session_id = ?",
+            (user_id, session_id),
+        )
+        .fetchone()
+    )
+    return row if row else (0, "")
+
+
+def put_rolling_summary(user_id, session_id, message_count, summary):
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO rolling_summaries (user_id, session_id, message_count, summary) VALUES (?, ?, ?, ?)",
+            (user_id, session_id, message_count, summary),
+        )
+
+
+def import_json_file(path, user_id, session_id):
+    if get_messages(user_id, session_id):
+        return 0
+
+    try:
+        with open(path, "r") as f:
+            messages = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+
+    append_messages(user_id, session_id, messages)
+    return len(messages)
+
+
+def import_json_files(directory="."):
+    imported = {}
+    for path in sorted(glob.glob(os.path.join(directory, "chat_*.json"))):
+        match = JSON_FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            imported[path] = import_json_file(
+                path, match["user_id"], match["session_id"]
+            )
+    return imported
+
+
+if __name__ == "__main__":
+    # Usage: python session_store.py [directory with chat_*.json files]
+    for path, count in import_json_files(*sys.argv[1:]).items():
+        print(f"Imported {count} messages from {path}")
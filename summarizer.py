@@ -0,0 +1,70 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from tokens import count_tokens, pack_chunks
+
+MAP_PROMPT = "Summarize the given content with all the important details."
+REDUCE_PROMPT = (
+    "Given the summaries separated by three newlines, generate a final summary."
+)
+SUMMARY_SEPARATOR = "\n\n\n"
+SUMMARY_MODEL = "gpt-4o-mini"
+MAX_CHUNK_TOKENS = 100000
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", 4))
+
+# Stored summaries are keyed by this, so editing a prompt or the chunk budget
+# invalidates only the summaries produced with the old settings
+PROMPT_VERSION = hashlib.sha256(
+    f"{MAP_PROMPT}{REDUCE_PROMPT}{SUMMARY_SEPARATOR}{MAX_CHUNK_TOKENS}".encode()
+).hexdigest()[:12]
+
+
+def summarize(
+    texts,
+    llm,
+    max_tokens=MAX_CHUNK_TOKENS,
+    concurrency=SUMMARY_CONCURRENCY,
+    log=None,
+):
+    log = log or (lambda message: None)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Chunks are submitted as soon as they are packed, so the map calls
+        # overlap with whatever is still producing the texts (e.g. OCR)
+        futures = [
+            pool.submit(llm, chunk, MAP_PROMPT)
+            for chunk in pack_chunks(texts, max_tokens)
+        ]
+        summaries = [future.result() for future in futures]
+        log(f"Summarized {len(summaries)} chunks.")
+
+        level = 0
+        while len(summaries) > 1:
+            groups = list(
+                pack_chunks(summaries, max_tokens, separator=SUMMARY_SEPARATOR)
+            )
+            if len(groups) >= len(summaries):
+                # Every summary fills the budget on its own. Summarize the
+                # long ones again by themselves and cut what the model won't
+                # shorten to half the budget, so pairs fit and the tree shrinks
+                half = max_tokens // 2
+                long = [
+                    i
+                    for i, summary in enumerate(summaries)
+                    if count_tokens(summary + SUMMARY_SEPARATOR) > half
+                ]
+                shorter = pool.map(lambda i: llm(summaries[i], MAP_PROMPT), long)
+                for i, summary in zip(long, shorter):
+                    summaries[i] = next(
+                        pack_chunks([summary], half, separator=SUMMARY_SEPARATOR)
+                    )
+                log(f"Re-summarized {len(long)} long summaries.")
+                groups = list(
+                    pack_chunks(summaries, max_tokens, separator=SUMMARY_SEPARATOR)
+                )
+
+            level += 1
+            summaries = list(pool.map(lambda group: llm(group, REDUCE_PROMPT), groups))
+            log(f"Reduce level {level}: {len(groups)} groups.")
+
+    return summaries[0] if summaries else ""
@@ -0,0 +1,60 @@
+import os
+import time
+import local_db
+from local_db import CACHE_DIR
+
+SUMMARY_STORE_PATH = os.path.join(CACHE_DIR, "summaries.sqlite3")
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS summaries (
+            content_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            pdf_url TEXT,
+            summary TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (content_hash, model, prompt_version, pdf_url)
+        )"""
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS summaries_url ON summaries (pdf_url, model, prompt_version)"
+    )
+
+
+def _connect():
+    return local_db.connect(SUMMARY_STORE_PATH, _create_tables)
+
+
+def get_summary(model, prompt_version, pdf_url=None, content_hash=None):
+    if content_hash is not None:
+        column, value = "content_hash", content_hash
+    else:
+        column, value = "pdf_url", pdf_url
+
+    with _connect() as conn:
+        row = conn.execute(
+            f"SELECT summary FROM summaries WHERE {column} = ? AND model = ? AND prompt_version = ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (value, model, prompt_version),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def put_summary(content_hash, model, prompt_version, summary, pdf_url=None):
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries "
+            "(content_hash, model, prompt_version, pdf_url, summary, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, model, prompt_version, pdf_url, summary, time.time()),
+        )
+
+
+def delete_stale(model, prompt_version):
+    with _connect() as conn:
+        return conn.execute(
+            "DELETE FROM summaries WHERE model != ? OR prompt_version != ?",
+            (model, prompt_version),
+        ).rowcount
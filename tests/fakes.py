@@ -0,0 +1,292 @@
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+
+
+class Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.count = None
+        self.filters = []
+        self.order_by = None
+        self.window = None
+        self.payload = None
+        self.conflict = None
+
+    def select(self, columns="*", count=None):
+        self.columns = None if columns == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column):
+        self.order_by = column
+        return self
+
+    def limit(self, n):
+        self.window = (0, n)
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end - start + 1)
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.action, self.payload, self.conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def execute(self):
+        return self.client._execute(self)
+
+
+class FakeSupabase:
+    # Enough of the supabase client for the tables this repo reads and writes.
+    # fail(n, after_write) makes the next n writes raise, after_write=True
+    # applies the write first like a timeout on a request that got through.
+    # reject(row) returning True fails any write containing that row.
+    # max_rows caps every select like PostgREST's db-max-rows
+    def __init__(self, latency=0.0, reject=None, max_rows=None):
+        self.latency = latency
+        self.reject = reject
+        self.max_rows = max_rows
+        self.tables = {}
+        self.next_id = {}
+        self.lock = threading.Lock()
+        self.failures = []
+        self.requests = 0
+
+    def table(self, name):
+        return Query(self, name)
+
+    def fail(self, n=1, after_write=False):
+        self.failures.extend([after_write] * n)
+
+    def rows(self, table):
+        return self.tables.setdefault(table, [])
+
+    def _matches(self, query):
+        return [row for row in self.rows(query.table) if all(f(row) for f in query.filters)]
+
+    def _execute(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            if query.action == "select":
+                rows = self._matches(query)
+                count = len(rows) if query.count else None
+                if query.order_by:
+                    rows = sorted(rows, key=lambda row: row[query.order_by])
+                if query.window:
+                    start, n = query.window
+                    rows = rows[start : start + n]
+                if self.max_rows is not None:
+                    rows = rows[: self.max_rows]
+                if query.columns:
+                    rows = [{c: row.get(c) for c in query.columns} for row in rows]
+                return Response([dict(row) for row in rows], count)
+
+            if self.reject and any(self.reject(row) for row in query.payload or []):
+                raise ValueError("row rejected")
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is False:
+                raise ConnectionError("injected failure")
+
+            if query.action == "delete":
+                doomed = {id(row) for row in self._matches(query)}
+                self.tables[query.table] = [
+                    row for row in self.rows(query.table) if id(row) not in doomed
+                ]
+                result = Response([])
+            else:
+                result = Response(self._write(query))
+
+            if failure:
+                raise TimeoutError("injected failure after the write")
+            return result
+
+    def _write(self, query):
+        table = self.rows(query.table)
+        keys = query.conflict.split(",") if query.conflict else []
+        by_key = {tuple(old.get(k) for k in keys): old for old in table} if keys else {}
+        written = []
+        for row in query.payload:
+            row = dict(row)
+            existing = by_key.get(tuple(row.get(k) for k in keys)) if keys else None
+            if existing is not None:
+                existing.update(row)
+                written.append(dict(existing))
+                continue
+            if "id" not in row:
+                self.next_id[query.table] = self.next_id.get(query.table, 0) + 1
+                row["id"] = self.next_id[query.table]
+            table.append(row)
+            if keys:
+                by_key[tuple(row.get(k) for k in keys)] = row
+            written.append(dict(row))
+        return written
+
+
+class FakeOpenAI:
+    # embeddings.create with deterministic unit vectors, one per input, and
+    # the API's limit of 2048 inputs per request
+    def __init__(self, dimensions=8, latency=0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.requests = []
+        self.embeddings = SimpleNamespace(create=self._create)
+
+    def _create(self, model, input, dimensions=None):
+        if len(input) > 2048:
+            raise ValueError("too many inputs")
+        if self.latency:
+            time.sleep(self.latency)
+        self.requests.append(len(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self.vector(text)) for text in input])
+
+    def vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        values = [b - 127.5 for b in digest[: self.dimensions]]
+        norm = sum(v * v for v in values) ** 0.5
+        return [v / norm for v in values]
+
+
+class FakeFirestore:
+    # The part of the Firestore client chat_history uses, documents keyed by
+    # their full path. reads and writes count document operations
+    def __init__(self):
+        self.docs = {}
+        self.ids = 0
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FirestoreCollection(self, name)
+
+    def batch(self):
+        return FirestoreBatch(self)
+
+    def _set(self, path, data, merge=False):
+        self.writes += 1
+        if merge and path in self.docs:
+            self.docs[path].update(data)
+        else:
+            self.docs[path] = dict(data)
+
+
+class FirestoreSnapshot:
+    def __init__(self, id, data):
+        self.id = id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FirestoreDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FirestoreCollection(self.db, f"{self.path}/{name}")
+
+    def set(self, data, merge=False):
+        self.db._set(self.path, data, merge)
+
+    def get(self):
+        self.db.reads += 1
+        return FirestoreSnapshot(self.id, self.db.docs.get(self.path))
+
+
+class FirestoreCollection:
+    def __init__(self, db, path, order=None, after=None, n=None):
+        self.db = db
+        self.path = path
+        self.order = order
+        self.after = after
+        self.n = n
+
+    def document(self, id=None):
+        if id is None:
+            self.db.ids += 1
+            id = f"auto-{self.db.ids:08d}"
+        return FirestoreDocument(self.db, f"{self.path}/{id}")
+
+    def order_by(self, field):
+        return FirestoreCollection(self.db, self.path, field, self.after, self.n)
+
+    def start_after(self, values):
+        return FirestoreCollection(self.db, self.path, self.order, values[self.order], self.n)
+
+    def limit(self, n):
+        return FirestoreCollection(self.db, self.path, self.order, self.after, n)
+
+    def stream(self):
+        prefix = self.path + "/"
+        docs = [
+            (path[len(prefix) :], data)
+            for path, data in self.db.docs.items()
+            if path.startswith(prefix) and "/" not in path[len(prefix) :]
+        ]
+        if self.order:
+            docs = [d for d in docs if self.order in d[1]]
+            docs.sort(key=lambda d: d[1][self.order])
+            if self.after is not None:
+                docs = [d for d in docs if d[1][self.order] > self.after]
+        docs = docs[: self.n] if self.n is not None else docs
+        self.db.reads += len(docs)
+        return [FirestoreSnapshot(id, dict(data)) for id, data in docs]
+
+
+class FirestoreBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.path, data, merge))
+
+    def commit(self):
+        if len(self.writes) > 500:
+            raise ValueError("too many writes in one batch")
+        self.db.commits += 1
+        for path, data, merge in self.writes:
+            self.db._set(path, data, merge)
@@ -0,0 +1,74 @@
+import sys
+import zlib
+
+# Digits as 3x5 dot matrices. Pages are drawn from filled rectangles, so the
+# PDF has no text layer and every page has to go through OCR
+DIGITS = {
+    "0": ["111", "101", "101", "101", "111"],
+    "1": ["010", "110", "010", "010", "111"],
+    "2": ["111", "001", "111", "100", "111"],
+    "3": ["111", "001", "111", "001", "111"],
+    "4": ["101", "101", "111", "001", "001"],
+    "5": ["111", "100", "111", "001", "111"],
+    "6": ["111", "100", "111", "101", "111"],
+    "7": ["111", "001", "010", "010", "010"],
+    "8": ["111", "101", "111", "101", "111"],
+    "9": ["111", "101", "111", "001", "111"],
+}
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+DOT = 5
+
+
+def _page_content(page_no):
+    ops = []
+    lines = [f"{page_no:04d}"] + [f"{(page_no * 7919 + n * 104729) % 10**8:08d}" for n in range(12)]
+    for line_no, line in enumerate(lines):
+        top = PAGE_HEIGHT - 72 - line_no * 8 * DOT
+        for char_no, char in enumerate(line):
+            left = 72 + char_no * 4 * DOT
+            for row, bits in enumerate(DIGITS[char]):
+                for col, bit in enumerate(bits):
+                    if bit == "1":
+                        ops.append(f"{left + col * DOT} {top - (row + 1) * DOT} {DOT} {DOT} re")
+    ops.append("f")
+    return "\n".join(ops).encode("ascii")
+
+
+def make_pdf(pages):
+    # A minimal PDF 1.4 file: catalog, page tree, then a page and its content
+    # stream per page, with a byte-exact xref table
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * n} 0 R" for n in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"))
+    for n in range(pages):
+        content = zlib.compress(_page_content(n + 1))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Contents {4 + 2 * n} 0 R /Resources << >> >>".encode("ascii")
+        )
+        objects.append(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)
+            + content
+            + b"\nendstream"
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+if __name__ == "__main__":
+    # Usage: python tests/pdf_fixture.py <out.pdf> [pages]
+    with open(sys.argv[1], "wb") as f:
+        f.write(make_pdf(int(sys.argv[2]) if len(sys.argv) > 2 else 20))
@@ -0,0 +1,68 @@
+import pytest
+
+import chat_history
+from fakes import FakeFirestore
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    chat_history.set_db(db)
+    yield db
+    chat_history.set_db(None)
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_append_writes_one_document_without_reading(db):
+    chat_history.store_chat_message("u", "s", {"role": "user", "content": "hello"})
+    chat_history.store_tool_call("u", "s", "result", "call-1")
+    assert (db.reads, db.writes) == (0, 2)
+
+    history = chat_history.get_chat_history("u", "s")
+    assert contents(history) == ["hello", "result"]
+    assert history[1]["tool_call_id"] == "call-1"
+    assert chat_history.get_chat_history("u", "other") == []
+
+
+def test_turn_is_one_batch_in_order(db):
+    turn = [{"role": "user", "content": f"m{n}"} for n in range(5)]
+    chat_history.store_chat_messages("u", "s", turn)
+    assert db.commits == 1
+    assert contents(chat_history.get_chat_history("u", "s")) == ["m0", "m1", "m2", "m3", "m4"]
+
+
+def test_history_is_read_in_pages(db):
+    chat_history.store_chat_messages(
+        "u", "s", [{"role": "user", "content": f"m{n}"} for n in range(7)]
+    )
+    page, cursor = chat_history.get_chat_history_page("u", "s", page_size=3)
+    assert contents(page) == ["m0", "m1", "m2"]
+    page, cursor = chat_history.get_chat_history_page("u", "s", 3, cursor)
+    assert contents(page) == ["m3", "m4", "m5"]
+    page, cursor = chat_history.get_chat_history_page("u", "s", 3, cursor)
+    assert (contents(page), cursor) == (["m6"], None)
+
+    assert len(chat_history.get_chat_history("u", "s", page_size=2)) == 7
+
+
+def test_legacy_array_is_imported_once_ahead_of_new_messages(db):
+    legacy = [
+        {"timestamp": "10:00:00 01-01-2024", "role": "user", "content": f"old{n}"}
+        for n in range(600)
+    ]
+    db.collection("chat_history").document("u_s").set({"messages": legacy})
+    chat_history.store_chat_message("u", "s", {"role": "user", "content": "new"})
+
+    history = chat_history.get_chat_history("u", "s", page_size=250)
+    assert len(history) == 601
+    assert contents(history[:2]) == ["old0", "old1"]
+    assert contents(history[-2:]) == ["old599", "new"]
+
+    # A fresh process checks again, but the marker stops a second import
+    chat_history.set_db(db)
+    writes = db.writes
+    assert len(chat_history.get_chat_history("u", "s")) == 601
+    assert db.writes == writes
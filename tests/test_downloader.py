@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import hashlib
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import local_db
+import downloader
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path, monkeypatch):
+    blob_dir = str(tmp_path / "blobs")
+    monkeypatch.setattr(downloader, "BLOB_DIR", blob_dir)
+    monkeypatch.setattr(downloader, "PARTIAL_DIR", os.path.join(blob_dir, "partial"))
+    monkeypatch.setattr(downloader, "BLOB_INDEX_PATH", os.path.join(blob_dir, "index.sqlite3"))
+    monkeypatch.setattr(downloader, "SEGMENT_THRESHOLD", 64 * 1024)
+    monkeypatch.setattr(downloader, "SEGMENT_SIZE", 16 * 1024)
+    yield
+    local_db.forget(downloader.BLOB_INDEX_PATH)
+
+
+def site(files):
+    # files maps a path to its bytes and can be changed while serving. ETags
+    # are content hashes, Range and If-Range are honoured
+    stats = {"200": 0, "206": 0, "304": 0, "head": 0, "truncate": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def respond(self, head=False):
+            data = files.get(self.path)
+            if data is None:
+                self.send_error(404)
+                return None
+            etag = '"%s"' % hashlib.sha256(data).hexdigest()[:16]
+            if self.headers.get("If-None-Match") == etag:
+                stats["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+            match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+            if match and self.headers.get("If-Range", etag) == etag and not head:
+                start = int(match[1])
+                end = int(match[2]) if match[2] else len(data) - 1
+                body = data[start : end + 1]
+                stats["206"] += 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                body = data
+                stats["head" if head else "200"] += 1
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            return body
+
+        def do_GET(self):
+            body = self.respond()
+            if body is None:
+                return
+            if stats["truncate"] and len(body) > 1000:
+                # Drop the connection mid-body once
+                stats["truncate"] -= 1
+                self.wfile.write(body[:1000])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.respond(head=True)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler, stats
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_large_file_is_fetched_in_segments(serve):
+    data = os.urandom(100 * 1024 + 7)
+    handler, stats = site({"/big.pdf": data})
+    url = serve(handler) + "/big.pdf"
+
+    info = downloader.download(url)
+    assert info["status"] == "downloaded"
+    assert read(info["path"]) == data
+    assert info["sha256"] == hashlib.sha256(data).hexdigest()
+    # The first GET only supplies the headers, every segment is a range
+    assert stats["206"] == 7
+    assert not os.listdir(downloader.PARTIAL_DIR)
+
+
+def test_small_file_is_one_request(serve):
+    handler, stats = site({"/small.pdf": b"%PDF small"})
+    url = serve(handler) + "/small.pdf"
+
+    assert read(downloader.download(url)["path"]) == b"%PDF small"
+    assert (stats["200"], stats["206"]) == (1, 0)
+
+
+def test_cached_and_not_modified(serve):
+    files = {"/doc.pdf": b"%PDF first"}
+    handler, stats = site(files)
+    url = serve(handler) + "/doc.pdf"
+    first = downloader.download(url)
+
+    cached = downloader.download(url)
+    assert cached["status"] == "cached"
+    assert cached["path"] == first["path"]
+    assert stats["200"] == 1
+
+    revalidated = downloader.download(url, revalidate=True)
+    assert revalidated["status"] == "not_modified"
+    assert stats["304"] == 1
+
+    files["/doc.pdf"] = b"%PDF second"
+    changed = downloader.download(url, revalidate=True)
+    assert changed["status"] == "downloaded"
+    assert read(changed["path"]) == b"%PDF second"
+    # Nothing refers to the old bytes any more
+    assert not os.path.exists(first["path"])
+
+
+def test_same_bytes_are_stored_once(serve):
+    handler, _ = site({"/a.pdf": b"%PDF same", "/b.pdf": b"%PDF same"})
+    base = serve(handler)
+    assert downloader.download(base + "/a.pdf")["path"] == downloader.download(base + "/b.pdf")["path"]
+
+
+def test_segment_resumes_after_dropped_connection(serve, monkeypatch):
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+    data = os.urandom(100 * 1024)
+    handler, stats = site({"/big.pdf": data})
+    url = serve(handler) + "/big.pdf"
+    stats["truncate"] = 2
+
+    assert read(downloader.download(url)["path"]) == data
+
+
+def test_is_modified(serve):
+    files = {"/doc.pdf": b"%PDF first"}
+    handler, stats = site(files)
+    url = serve(handler) + "/doc.pdf"
+    info = downloader.download(url)
+
+    assert not downloader.is_modified(url, info["etag"], None)
+    files["/doc.pdf"] = b"%PDF second"
+    assert downloader.is_modified(url, info["etag"], None)
+    assert downloader.is_modified(url, None, None)
+    # Only conditional HEADs, the body was never sent again
+    assert stats["200"] == 1
+
+
+def test_least_recently_used_blobs_are_evicted(serve, monkeypatch):
+    monkeypatch.setattr(downloader, "EVICT_MIN_AGE", 0)
+    handler, _ = site({f"/{n}.pdf": os.urandom(1000) for n in range(3)})
+    base = serve(handler)
+    paths = [downloader.download(f"{base}/{n}.pdf")["path"] for n in range(3)]
+
+    time.sleep(0.01)
+    downloader.download(f"{base}/0.pdf")
+    assert downloader.evict(max_bytes=2000) == 1
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert downloader.lookup(f"{base}/1.pdf") is None
+
+
+def test_recent_blobs_outlive_the_cap(serve):
+    handler, _ = site({f"/{n}.pdf": os.urandom(1000) for n in range(2)})
+    base = serve(handler)
+    for n in range(2):
+        downloader.download(f"{base}/{n}.pdf")
+    assert downloader.evict(max_bytes=0) == 0
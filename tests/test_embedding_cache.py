@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+import local_db
+import embedding_cache
+from fakes import FakeOpenAI
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite3")
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", path)
+    monkeypatch.setattr(embedding_cache, "_memory", embedding_cache.OrderedDict())
+    yield path
+    local_db.forget(path)
+
+
+def test_disk_tier_is_reused(cache, monkeypatch):
+    client = FakeOpenAI()
+    first = embedding_cache.embed(client, ["pension rules", "pay scale"])
+    monkeypatch.setattr(embedding_cache, "_memory", embedding_cache.OrderedDict())
+    again = embedding_cache.embed(client, ["pay  scale", "pension rules"])
+    # The disk tier stores float32
+    assert [pytest.approx(v, abs=1e-6) for v in first[::-1]] == again
+    assert client.requests == [2]
+
+
+def test_least_recently_used_vectors_are_evicted(cache, monkeypatch):
+    client = FakeOpenAI()
+    texts = ["first", "second", "third"]
+    for text in texts:
+        embedding_cache.embed(client, [text])
+    # A disk hit on "first" makes "second" the least recently used
+    monkeypatch.setattr(embedding_cache, "_memory", embedding_cache.OrderedDict())
+    embedding_cache.embed(client, ["first"])
+
+    assert embedding_cache.evict(max_bytes=2 * 8 * 4) == 1
+    keys = {embedding_cache.cache_key(text, embedding_cache.EMBEDDING_MODEL): text for text in texts}
+    with embedding_cache._connect() as conn:
+        stored = {keys[row[0]] for row in conn.execute("SELECT key FROM embeddings")}
+    assert stored == {"first", "third"}
+    assert len(client.requests) == 3
+
+
+def test_existing_cache_is_migrated(tmp_path, monkeypatch):
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+    )
+    conn.execute("INSERT INTO embeddings VALUES ('k', 'm', ?)", (b"\0" * 12,))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", path)
+    try:
+        assert embedding_cache.evict(max_bytes=100) == 0
+        assert embedding_cache.evict(max_bytes=0) == 1
+    finally:
+        local_db.forget(path)
@@ -0,0 +1,109 @@
+import os
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import gr_pages
+import scrape_state
+from conftest import FIXTURES
+
+GR_FIXTURES = os.path.join(FIXTURES, "gr")
+TABLES = {"A": "000.html", "B": "001.html", "C": "002.html"}
+
+
+def read(name):
+    with open(os.path.join(GR_FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def site(ignore_branch=False):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/gr.html" and not url.query:
+                body = read("gr.html")
+            elif url.path == "/gr.html":
+                branch = "A" if ignore_branch else parse_qs(url.query)["branch"][0]
+                body = read(TABLES[branch])
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def crawl(base, **kwargs):
+    return gr_pages.iter_branch_rows_http(
+        base + "/gr.html", base + "/gr.html?branch={value}", delay=0, **kwargs
+    )
+
+
+def test_parse_branches_skips_placeholders():
+    assert gr_pages.parse_branches(read("gr.html")) == [
+        ("A", "Budget"),
+        ("B", "Pay Commission"),
+        ("C", "Pension"),
+    ]
+
+
+def test_parse_table():
+    rows = gr_pages.parse_table(read("001.html"), "Pay Commission")
+    assert [row["gr_no"] for row in rows] == ["PGR-1023-7-M", "PGR-1023-3-M"]
+    assert rows[0]["subject"] == "સાતમા પગાર પંચ મુજબ ભથ્થાં"
+    assert rows[0]["pdf_url"] == gr_pages.SITE_URL + "/downloads/pgr_7.pdf"
+    assert rows[1]["pdf_url"] is None
+    assert gr_pages.parse_table(read("002.html"), "Pension") == []
+    assert gr_pages.parse_table(read("gr.html"), "Budget") is None
+
+
+def test_http_crawl_matches_saved_fixtures(serve):
+    base = serve(site())
+    fetched = dict(crawl(base))
+    assert list(fetched) == ["Budget", "Pay Commission", "Pension"]
+    fixtures = gr_pages.load_fixtures(GR_FIXTURES)
+    assert gr_pages.compare_with_fixtures(fixtures, fetched) == []
+
+
+def test_http_crawl_rejects_identical_tables(serve):
+    base = serve(site(ignore_branch=True))
+    yielded = []
+    with pytest.raises(ValueError, match="same table"):
+        for item in crawl(base):
+            yielded.append(item)
+    # The ambiguous first branch is never handed out
+    assert yielded == []
+
+
+def test_compare_reports_missing_rows():
+    fixtures = gr_pages.load_fixtures(GR_FIXTURES)
+    fetched = dict(fixtures, **{"Pay Commission": fixtures["Budget"]})
+    del fetched["Pension"]
+    problems = gr_pages.compare_with_fixtures(fixtures, fetched)
+    assert len(problems) == 2
+    assert problems[0].startswith("Pay Commission: 2 of 2")
+    assert problems[1] == "Pension: missing from the HTTP crawl"
+
+
+def test_save_and_load_fixtures_round_trip(tmp_path):
+    tables = [(name, read(TABLES[value])) for value, name in [("A", "Budget"), ("B", "Pay")]]
+    assert gr_pages.save_fixtures(str(tmp_path), tables) == 2
+    fixtures = gr_pages.load_fixtures(str(tmp_path))
+    assert [row["gr_no"] for row in fixtures["Pay"]] == ["PGR-1023-7-M", "PGR-1023-3-M"]
+
+
+def test_branch_url_needs_confirmation(tmp_path, monkeypatch):
+    monkeypatch.setattr(scrape_state, "SCRAPE_STATE_PATH", str(tmp_path / "state.sqlite3"))
+    url = "https://example.invalid/gr.html?branch={value}"
+    assert not scrape_state.is_confirmed(url)
+    scrape_state.confirm(url)
+    assert scrape_state.is_confirmed(url)
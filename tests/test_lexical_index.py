@@ -0,0 +1,76 @@
+import pytest
+
+import local_db
+import lexical_index
+from fakes import FakeSupabase
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    path = str(tmp_path / "lexical.sqlite3")
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_PATH", path)
+    yield
+    local_db.forget(path)
+
+
+def add_vector(supabase, doc_id, chunk_no, body):
+    supabase.table("vectors").insert([{"doc_id": doc_id, "chunk_no": chunk_no, "body": body}]).execute()
+
+
+def doc_ids(text):
+    return {row["doc_id"] for row in lexical_index.search(text)}
+
+
+def test_tokenize_folds_gujarati_digits():
+    assert lexical_index.tokenize("GR of ૨૦૨૪ for Pension") == ["gr", "2024", "pension"]
+
+
+def test_sync_adds_new_rows(index):
+    supabase = FakeSupabase()
+    add_vector(supabase, 1, 1, "dearness allowance revised")
+    add_vector(supabase, 2, 1, "pension commutation rules")
+    assert lexical_index.sync(supabase) == (2, 0)
+    assert doc_ids("pension") == {2}
+
+    add_vector(supabase, 3, 1, "pension for family members")
+    assert lexical_index.sync(supabase) == (1, 0)
+    assert doc_ids("pension") == {2, 3}
+
+
+def test_sync_removes_rows_deleted_upstream(index):
+    supabase = FakeSupabase()
+    add_vector(supabase, 1, 1, "dearness allowance revised")
+    add_vector(supabase, 2, 1, "pension commutation rules")
+    add_vector(supabase, 2, 2, "pension arrears")
+    lexical_index.sync(supabase)
+
+    # Another process re-indexed document 2 into a single chunk
+    supabase.table("vectors").delete().eq("doc_id", 2).execute()
+    add_vector(supabase, 2, 1, "revised pension commutation rules")
+    assert lexical_index.sync(supabase) == (1, 1)
+    assert [row["body"] for row in lexical_index.search("pension")] == [
+        "revised pension commutation rules"
+    ]
+
+    supabase.table("vectors").delete().eq("doc_id", 1).execute()
+    assert lexical_index.sync(supabase) == (0, 1)
+    assert doc_ids("allowance") == set()
+
+
+def test_sync_picks_up_rows_committed_out_of_order(index, monkeypatch):
+    supabase = FakeSupabase()
+    table = supabase.rows("vectors")
+    table.append({"id": 1, "doc_id": 1, "chunk_no": 1, "body": "dearness allowance"})
+    table.append({"id": 5, "doc_id": 2, "chunk_no": 1, "body": "pension rules"})
+    assert lexical_index.sync(supabase) == (2, 0)
+
+    # Id 2 was taken first but committed after id 5 had been synced
+    table.append({"id": 2, "doc_id": 1, "chunk_no": 2, "body": "leave travel concession"})
+    assert lexical_index.sync(supabase) == (1, 0)
+    assert doc_ids("travel") == {1}
+
+    monkeypatch.setattr(lexical_index, "SYNC_RESCAN_IDS", 0)
+    table.append({"id": 4, "doc_id": 3, "chunk_no": 1, "body": "gratuity ceiling"})
+    assert lexical_index.sync(supabase) == (1, 0)
+    assert doc_ids("gratuity") == {3}
+    assert lexical_index.sync(supabase) == (0, 0)
@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from pdf_fixture import make_pdf
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MB = 512
+
+# Runs in a fresh interpreter so ru_maxrss only sees this document's OCR.
+# RUSAGE_CHILDREN covers the pool workers and their pdftoppm and tesseract
+# processes once the pool has been shut down
+MEASURE = """
+import sys, json, resource
+import ocr
+with open(sys.argv[1], "rb") as f:
+    pages = ocr.extract_pages(f.read(), lang="eng", workers=4, use_cache=False)
+ocr.shutdown_pool()
+print(json.dumps({
+    "pages": len(pages),
+    "ocr": sum(page["source"] == "ocr" for page in pages),
+    "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+}))
+"""
+
+
+@pytest.mark.skipif(
+    not (shutil.which("pdftoppm") and shutil.which("tesseract")),
+    reason="needs poppler's pdftoppm and tesseract",
+)
+def test_peak_memory_of_a_long_scan_stays_within_budget(tmp_path):
+    for module in ("PyPDF2", "pytesseract", "pdf2image"):
+        pytest.importorskip(module)
+    pdf_path = tmp_path / "scan.pdf"
+    pdf_path.write_bytes(make_pdf(100))
+
+    env = dict(os.environ, OCR_MAX_MEMORY_MB=str(BUDGET_MB))
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE, str(pdf_path)],
+        cwd=REPO,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    usage = json.loads(result.stdout.splitlines()[-1])
+    assert (usage["pages"], usage["ocr"]) == (100, 100)
+    # ru_maxrss is in KiB on Linux
+    assert (usage["self"] + usage["children"]) / 1024 < BUDGET_MB
@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+
+from query_compiler import parse_date_range, compile_filters
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2023", (date(2023, 1, 1), date(2024, 1, 1))),
+        ("2024-01", (date(2024, 1, 1), date(2024, 2, 1))),
+        ("Jan 2019", (date(2019, 1, 1), date(2019, 2, 1))),
+        ("12/06/2005", (date(2005, 6, 12), date(2005, 6, 13))),
+        ("26-Sep-2024", (date(2024, 9, 26), date(2024, 9, 27))),
+        ("2016-17", (date(2016, 4, 1), date(2017, 4, 1))),
+        ("2016-2017", (date(2016, 4, 1), date(2017, 4, 1))),
+        ("FY 2011-12", (date(2011, 4, 1), date(2012, 4, 1))),
+        ("1999-00", (date(1999, 4, 1), date(2000, 4, 1))),
+        ("૨૦૧૬-૧૭", (date(2016, 4, 1), date(2017, 4, 1))),
+        # Without the prefix a valid month wins
+        ("2011-12", (date(2011, 12, 1), date(2012, 1, 1))),
+    ],
+)
+def test_parse_date_range(value, expected):
+    assert parse_date_range(value) == expected
+
+
+@pytest.mark.parametrize("value", ["2016-18", "2016-2018", "2024-0", "someday"])
+def test_unparseable_dates_name_the_input(value):
+    with pytest.raises(ValueError, match=f"Unrecognized date: {value}"):
+        parse_date_range(value)
+
+
+def test_financial_year_filter():
+    assert compile_filters({"date": "2016-17"}) == (
+        ("gte", "date", "2016-04-01"),
+        ("lt", "date", "2017-04-01"),
+    )
@@ -0,0 +1,52 @@
+import json
+import threading
+
+import pytest
+
+import local_db
+import session_store
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.sqlite3")
+    monkeypatch.setattr(session_store, "SESSION_DB_PATH", path)
+    monkeypatch.setattr(session_store, "_cache", session_store.OrderedDict())
+    yield
+    local_db.forget(path)
+
+
+def test_json_sessions_are_imported_once(tmp_path):
+    messages = [
+        {"role": "user", "content": "Latest DA rate?"},
+        {"role": "assistant", "content": "46% from July 2023."},
+    ]
+    path = tmp_path / "chat_user-1_session_abc.json"
+    path.write_text(json.dumps(messages))
+    (tmp_path / "chat_broken.json").write_text("not a session")
+
+    assert session_store.import_json_files(str(tmp_path)) == {str(path): 2}
+    assert session_store.get_messages("user-1", "session_abc") == messages
+    # Already imported sessions are left alone
+    assert session_store.import_json_files(str(tmp_path)) == {str(path): 0}
+    assert len(session_store.get_messages("user-1", "session_abc")) == 2
+
+
+def test_appends_from_two_threads_are_all_read_back():
+    # Warm the cache so the read below has to pick up the threads' rows
+    assert session_store.get_messages("u", "s") == []
+
+    def append(name):
+        for n in range(50):
+            session_store.append_message("u", "s", {"role": "user", "content": f"{name}{n}"})
+
+    threads = [threading.Thread(target=append, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    contents = [m["content"] for m in session_store.get_messages("u", "s")]
+    assert len(contents) == 100
+    for name in "ab":
+        assert [c for c in contents if c.startswith(name)] == [f"{name}{n}" for n in range(50)]
@@ -0,0 +1,79 @@
+import time
+import threading
+
+import pytest
+
+pytest.importorskip("tiktoken")
+
+import summarizer
+from tokens import count_tokens
+
+
+class FakeLLM:
+    # Records every call and how many ran at once. reply(text, prompt)
+    # decides what comes back
+    def __init__(self, reply, latency=0.0):
+        self.reply = reply
+        self.latency = latency
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text, prompt):
+        with self.lock:
+            self.calls.append((text, prompt))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+        return self.reply(text, prompt)
+
+    def prompts(self):
+        return [prompt for _, prompt in self.calls]
+
+
+def pages(n, words=90):
+    # Each page fills most of a 100 token chunk, so every page is its own chunk
+    return [" ".join(["pension"] * words) for _ in range(n)]
+
+
+def test_empty_input_makes_no_calls():
+    llm = FakeLLM(lambda text, prompt: "summary")
+    assert summarizer.summarize([], llm) == ""
+    assert llm.calls == []
+
+
+def test_single_chunk_is_summarized_once():
+    llm = FakeLLM(lambda text, prompt: "summary")
+    assert summarizer.summarize(["one short page"], llm) == "summary"
+    assert llm.prompts() == [summarizer.MAP_PROMPT]
+
+
+def test_map_calls_run_concurrently():
+    llm = FakeLLM(lambda text, prompt: "summary", latency=0.05)
+    summarizer.summarize(pages(8), llm, max_tokens=100, concurrency=4)
+    assert llm.peak == 4
+    assert llm.prompts().count(summarizer.MAP_PROMPT) == 8
+
+
+def test_reduce_tree_halves_each_level():
+    # Two 40 token summaries fit a 100 token group, three don't
+    log = []
+    llm = FakeLLM(lambda text, prompt: " ".join(["summary"] * 40))
+    summarizer.summarize(pages(8), llm, max_tokens=100, log=log.append)
+    assert [m for m in log if m.startswith("Reduce")] == [
+        "Reduce level 1: 4 groups.",
+        "Reduce level 2: 2 groups.",
+        "Reduce level 3: 1 groups.",
+    ]
+
+
+def test_summaries_that_fill_the_budget_are_never_joined_over_it():
+    # The model echoes its input, so no summary ever gets shorter
+    llm = FakeLLM(lambda text, prompt: text)
+    summarizer.summarize(pages(4, words=95), llm, max_tokens=100)
+    assert all(count_tokens(text) <= 100 for text, _ in llm.calls)
+    assert llm.prompts()[-1] == summarizer.REDUCE_PROMPT
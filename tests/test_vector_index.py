@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+import pytest
+
+import local_db
+import vector_index
+
+DIM = 32
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = vector_index.VectorIndex(str(tmp_path), DIM, "int8")
+    yield index
+    local_db.forget(index.db_path)
+
+
+def unit(rng, n):
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def rows(doc_id, vectors, first_id):
+    return [
+        {"id": first_id + i, "doc_id": doc_id, "chunk_no": i + 1, "body": f"{doc_id}:{i + 1}", "embedding": v}
+        for i, v in enumerate(vectors)
+    ]
+
+
+def test_reindexed_document_keeps_k_results(index):
+    rng = np.random.default_rng(0)
+    doc = unit(rng, 20)
+    for n in range(3):
+        index.remove(1)
+        index.add(rows(1, doc, 1 + 100 * n))
+
+    results = index.search(doc[0], 10)
+    assert len(results) == 10
+    assert len({row["chunk_no"] for row in results}) == 10
+    assert results[0]["id"] == 201
+
+
+def test_compact_drops_tombstones(index):
+    rng = np.random.default_rng(1)
+    doc = unit(rng, 20)
+    index.add(rows(1, doc, 1))
+    index.add(rows(2, unit(rng, 20), 101))
+    index.remove(1)
+
+    assert index.compact() == 20
+    assert index.compact() == 0
+    state = index._refresh()
+    assert state.count == 20 and not state.deleted.any()
+    assert {row["doc_id"] for row in index.search(doc[0], 10)} == {2}
+
+    index.add(rows(1, doc, 201))
+    assert index.search(doc[3], 1)[0]["id"] == 204
+
+
+def test_search_during_writes(index):
+    rng = np.random.default_rng(2)
+    index.add(rows(2, unit(rng, 20), 100001))
+    doc = unit(rng, 20)
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        queries = unit(np.random.default_rng(), 50)
+        while not stop.is_set():
+            for q in queries:
+                try:
+                    assert len(index.search(q, 10)) == 10
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+    readers = [threading.Thread(target=search) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for n in range(60):
+            index.remove(1)
+            index.add(rows(1, doc, 1 + 100 * n))
+            if n % 10 == 5:
+                index.compact()
+            if n % 20 == 10:
+                index.train(nlist=4)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert not errors, errors[0]
+
+
+def test_sync_picks_up_late_commits_and_upstream_deletes(index, monkeypatch):
+    from fakes import FakeSupabase
+
+    rng = np.random.default_rng(3)
+    supabase = FakeSupabase()
+    vectors = rows(1, unit(rng, 6), 1)
+    table = supabase.rows("vectors")
+    # Ids 2 and 5 were taken by a writer whose commit lands after the others
+    table.extend(dict(row, embedding=row["embedding"].tolist()) for row in vectors if row["id"] not in (2, 5))
+    assert index.sync(supabase) == (4, 0)
+
+    table.append(dict(vectors[1], embedding=vectors[1]["embedding"].tolist()))
+    assert index.sync(supabase) == (1, 0)
+    assert index.search(vectors[1]["embedding"], 1)[0]["id"] == 2
+
+    # Outside the rescan window only the count check notices it
+    monkeypatch.setattr(vector_index, "SYNC_RESCAN_IDS", 0)
+    table.append(dict(vectors[4], embedding=vectors[4]["embedding"].tolist()))
+    assert index.sync(supabase) == (1, 0)
+    assert index.search(vectors[4]["embedding"], 1)[0]["id"] == 5
+
+    supabase.table("vectors").delete().in_("id", [1, 2]).execute()
+    assert index.sync(supabase) == (0, 2)
+    assert {row["id"] for row in index.search(vectors[0]["embedding"], 10)} == {3, 4, 5, 6}
+    assert index.sync(supabase) == (0, 0)
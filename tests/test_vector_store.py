@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+pytest.importorskip("tiktoken")
+pytest.importorskip("langchain_text_splitters")
+
+import local_db
+import embedding_cache
+import lexical_index
+import vector_store
+from fakes import FakeSupabase, FakeOpenAI
+
+
+@pytest.fixture(autouse=True)
+def stores(tmp_path, monkeypatch):
+    paths = {
+        "embeddings": str(tmp_path / "embeddings.sqlite3"),
+        "lexical": str(tmp_path / "lexical.sqlite3"),
+    }
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", paths["embeddings"])
+    monkeypatch.setattr(embedding_cache, "_memory", embedding_cache.OrderedDict())
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_PATH", paths["lexical"])
+    yield
+    for path in paths.values():
+        local_db.forget(path)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(vector_store.time, "sleep", slept.append)
+    return slept
+
+
+def chunks(n):
+    return [f"Government resolution {i} on pension and allowances." for i in range(n)]
+
+
+def test_retry_after_applied_write_does_not_duplicate(sleeps):
+    supabase = FakeSupabase()
+    supabase.fail(1, after_write=True)
+    vector_store.insert_chunks(supabase, 7, chunks(3), [[0.0]] * 3)
+
+    rows = supabase.rows("vectors")
+    assert sorted(row["chunk_no"] for row in rows) == [1, 2, 3]
+    assert sleeps == [1]
+
+
+def test_bad_row_is_isolated_without_backoff_per_level(sleeps):
+    supabase = FakeSupabase(reject=lambda row: row["chunk_no"] == 300)
+    with pytest.raises(ValueError, match=r"1 of 500 chunks .* \(chunk_no \[300\]\)"):
+        vector_store.insert_chunks(supabase, 7, chunks(500), [[0.0]] * 500)
+
+    stored = {row["chunk_no"] for row in supabase.rows("vectors")}
+    assert stored == set(range(1, 501)) - {300}
+    assert 299 in stored and 301 in stored and 500 in stored
+    # The stored neighbours are searchable lexically, the bad row isn't
+    # Chunk text i is chunk_no i + 1
+    assert [row["chunk_no"] for row in lexical_index.search("300", 1)] == [301]
+    assert lexical_index.search("299") == []
+    # Backoff only for the full batch, not again at every bisection level
+    assert sleeps == [1, 2, 4, 8]
+
+
+def test_offline_throughput():
+    # 5 ms per request on both fakes: batching turns thousands of round
+    # trips into a handful, which is what the throughput measures
+    openai = FakeOpenAI(latency=0.005)
+    supabase = FakeSupabase(latency=0.005)
+    texts = chunks(5000)
+
+    start = time.perf_counter()
+    embeddings = vector_store.embed_in_batches(openai, texts)
+    vector_store.insert_chunks(supabase, 1, texts, embeddings)
+    seconds = time.perf_counter() - start
+
+    assert openai.requests == [512] * 9 + [392]
+    assert supabase.requests == 10
+    assert len(supabase.rows("vectors")) == 5000
+    print(f"{5000 / seconds:.0f} chunks/s")
+
+
+def test_get_chunks_reads_past_max_rows():
+    supabase = FakeSupabase(max_rows=1000)
+    supabase.rows("vectors").extend(
+        {"doc_id": 1, "chunk_no": n, "body": f"chunk {n}", "embedding": "[0.5, 0.5]"}
+        for n in range(2500, 0, -1)
+    )
+    stored = vector_store.get_chunks(supabase, 1)
+    assert [row["chunk_no"] for row in stored] == list(range(1, 2501))
+    assert stored[0]["embedding"] == [0.5, 0.5]
+    assert supabase.requests == 3
@@ -0,0 +1,66 @@
+import sys
+import time
+import tiktoken
+
+ENCODING = tiktoken.encoding_for_model("gpt-4o-mini")
+
+
+def count_tokens(text):
+    return len(ENCODING.encode(text))
+
+
+def pack_chunks(texts, max_tokens, separator="\n"):
+    separator_tokens = count_tokens(separator)
+    parts = []
+    used = 0
+
+    for text in texts:
+        tokens = ENCODING.encode(text)
+
+        # A single text that can't fit on its own is cut at token boundaries
+        while len(tokens) > max_tokens - separator_tokens:
+            if parts:
+                yield separator.join(parts)
+                parts, used = [], 0
+            head = max_tokens - separator_tokens
+            yield ENCODING.decode(tokens[:head])
+            tokens = tokens[head:]
+            text = ENCODING.decode(tokens)
+
+        size = len(tokens) + separator_tokens
+        if parts and used + size > max_tokens:
+            yield separator.join(parts)
+            parts, used = [], 0
+
+        parts.append(text)
+        used += size
+
+    if parts:
+        yield separator.join(parts)
+
+
+if __name__ == "__main__":
+    # Usage: python tokens.py [pages]
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    page = "ગુજરાત સરકાર નાણાં વિભાગ Finance Department resolution. " * 60
+    pages = [f"Page {n}\n{page}" for n in range(page_count)]
+    max_tokens = 100000
+
+    start = time.perf_counter()
+    naive, text = [], ""
+    for page_text in pages:
+        if len(ENCODING.encode(text + page_text + "\n")) < max_tokens:
+            text += page_text + "\n"
+        else:
+            naive.append(text)
+            text = page_text + "\n"
+    naive.append(text)
+    naive_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed = list(pack_chunks(pages, max_tokens))
+    packed_seconds = time.perf_counter() - start
+
+    print(f"{page_count} pages, {count_tokens(chr(10).join(pages))} tokens")
+    print(f"re-encode buffer: {naive_seconds:.2f}s, {len(naive)} chunks")
+    print(f"pack_chunks:      {packed_seconds:.2f}s, {len(packed)} chunks")
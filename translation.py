@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+import local_db
+from local_db import CACHE_DIR
+
+TRANSLATION_CACHE_PATH = os.path.join(CACHE_DIR, "translations.sqlite3")
+TRANSLATION_BACKEND = os.environ.get("TRANSLATION_BACKEND", "google")
+# Google rejects requests over 5000 characters
+TRANSLATION_BATCH_CHARS = 4500
+TRANSLATION_DELIMITER = "\n"
+
+
+class GoogleBackend:
+    def translate(self, text, target):
+        from deep_translator import GoogleTranslator
+
+        return GoogleTranslator(source="auto", target=target).translate(text)
+
+
+class NullBackend:
+    # Leaves text as is, for offline runs and benchmarks
+    def translate(self, text, target):
+        return text
+
+
+BACKENDS = {"google": GoogleBackend, "none": NullBackend}
+
+
+def detect_script(text):
+    gujarati = sum(1 for c in text if "઀" <= c <= "૿")
+    latin = sum(1 for c in text if c.isascii() and c.isalpha())
+    if gujarati and latin:
+        return None
+    if gujarati:
+        return "gu"
+    if latin:
+        return "en"
+    # Only digits and punctuation, nothing to translate
+    return "none"
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def _key(text, target):
+    return hashlib.sha256(f"{target}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _create_tables(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS translations (
+            key TEXT PRIMARY KEY,
+            target TEXT NOT NULL,
+            source TEXT NOT NULL,
+            text TEXT NOT NULL
+        )"""
+    )
+
+
+def _connect():
+    return local_db.connect(TRANSLATION_CACHE_PATH, _create_tables)
+
+
+class Translator:
+    def __init__(self, backend=None, batch_chars=TRANSLATION_BATCH_CHARS):
+        self.backend = backend or BACKENDS[TRANSLATION_BACKEND]()
+        self.batch_chars = batch_chars
+        self.lock = threading.Lock()
+        self.stats = {"skipped": 0, "cached": 0, "translated": 0, "requests": 0}
+
+    def _count(self, name, n):
+        with self.lock:
+            self.stats[name] += n
+
+    def _batches(self, texts):
+        batch, size = [], 0
+        for text in texts:
+            if batch and size + len(text) + len(TRANSLATION_DELIMITER) > self.batch_chars:
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + len(TRANSLATION_DELIMITER)
+        if batch:
+            yield batch
+
+    def _request(self, batch, target):
+        self._count("requests", 1)
+        translated = self.backend.translate(TRANSLATION_DELIMITER.join(batch), target)
+        parts = (translated or "").split(TRANSLATION_DELIMITER)
+        if len(parts) == len(batch):
+            return [part.strip() for part in parts]
+
+        # The backend merged or split lines, so the batch can't be realigned
+        if len(batch) == 1:
+            return [normalize(translated or batch[0])]
+        results = []
+        for text in batch:
+            results.extend(self._request([text], target))
+        return results
+
+    def translate(self, texts, target):
+        texts = [normalize(text) for text in texts]
+        results = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            if detect_script(text) in (target, "none"):
+                results[text] = text
+            else:
+                missing.append(text)
+        self._count("skipped", sum(1 for text in texts if text in results))
+
+        if missing:
+            keys = {text: _key(text, target) for text in missing}
+            with _connect() as conn:
+                for start in range(0, len(missing), 500):
+                    batch = [keys[text] for text in missing[start : start + 500]]
+                    rows = conn.execute(
+                        f"SELECT source, text FROM translations WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    results.update(rows)
+            self._count("cached", sum(1 for text in missing if text in results))
+
+            missing = [text for text in missing if text not in results]
+            for batch in self._batches(missing):
+                translated = self._request(batch, target)
+                with _connect() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO translations (key, target, source, text) VALUES (?, ?, ?, ?)",
+                        [
+                            (keys[text], target, text, result)
+                            for text, result in zip(batch, translated)
+                        ],
+                    )
+                results.update(zip(batch, translated))
+                self._count("translated", len(batch))
+
+        return [results[text] for text in texts]
+
+    def translate_rows(self, rows):
+        # Replaces each row's "subject" with "subject_en" and "subject_gu"
+        subjects = [row.pop("subject") for row in rows]
+        for target in ("en", "gu"):
+            for row, text in zip(rows, self.translate(subjects, target)):
+                row[f"subject_{target}"] = text
+        return rows
@@ -0,0 +1,775 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import numpy as np
+import local_db
+from local_db import CACHE_DIR
+from embedding_cache import EMBEDDING_DIMENSIONS, FULL_DIMENSIONS
+
+VECTOR_INDEX_DIR = os.path.join(CACHE_DIR, "vector_index")
+VECTOR_INDEX_SYNC_SECONDS = int(os.environ.get("VECTOR_INDEX_SYNC_SECONDS", 300))
+# "none" scans the float32 vectors, "int8" and "binary" scan compact codes and
+# only rescore a shortlist at full precision. int8 saves memory, not time:
+# numpy has no BLAS path for integer products, so its codes are widened to
+# float32 per block and a scan is ~1.3x slower than "none" once the float32
+# file is in the page cache. It only pays off when that file isn't
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+RESCORE_FACTOR = {"int8": 4, "binary": 20}
+BLOCK_ROWS = 65536
+# int8 codes are widened to float32 per block, keep that copy cache sized.
+# Larger blocks and int32 accumulation both measured slower
+INT8_BLOCK_ROWS = 2048
+MIN_TRAIN_ROWS = 4096
+# Compact once this share of the rows are tombstones
+COMPACT_RATIO = 0.2
+NPROBE = 8
+SYNC_PAGE_SIZE = 1000
+# Concurrent writers can commit ids out of order, so this many ids below the
+# newest one seen are listed again on every sync
+SYNC_RESCAN_IDS = 5000
+# ids per in.() filter, keeps the request URL well under proxy limits
+SYNC_FETCH_IDS = 300
+
+_index = None
+_index_lock = threading.Lock()
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(bits):
+        return _POPCOUNT[bits]
+
+
+MIGRATION_SQL = """\
+-- pgvector >= 0.7, text-embedding-3 prefixes stay valid once renormalized
+ALTER TABLE vectors ALTER COLUMN embedding TYPE vector({dim})
+    USING l2_normalize(subvector(embedding, 1, {dim}))::vector({dim});
+-- then recreate match_documents with a query_embedding vector({dim}) argument
+-- and set EMBEDDING_DIMENSIONS={dim}"""
+
+
+def reduce(vectors, dim):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[-1] == dim:
+        return vectors
+    vectors = vectors[..., :dim]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def encode(vectors):
+    scales = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    scales[scales == 0] = 1
+    return {
+        "int8": np.round(vectors / scales).astype(np.int8),
+        "scales": scales.astype(np.float32),
+        "bits": np.packbits(vectors > 0, axis=1),
+    }
+
+
+class _Snapshot:
+    # What one search reads, built off to the side and published in a single
+    # assignment so a concurrent refresh never shows a half updated index
+    def __init__(
+        self,
+        version=None,
+        count=0,
+        matrix=None,
+        codes=None,
+        centroids=None,
+        centroids_mtime=None,
+        lists=(),
+        unassigned=None,
+        deleted=None,
+    ):
+        self.version = version
+        self.count = count
+        self.matrix = matrix
+        self.codes = codes or {}
+        self.centroids = centroids
+        self.centroids_mtime = centroids_mtime
+        self.lists = lists
+        self.unassigned = np.empty(0, dtype=np.int64) if unassigned is None else unassigned
+        self.deleted = np.zeros(0, dtype=bool) if deleted is None else deleted
+
+
+class VectorIndex:
+    def __init__(
+        self, path=VECTOR_INDEX_DIR, dim=EMBEDDING_DIMENSIONS, quantization=VECTOR_QUANTIZATION
+    ):
+        if quantization not in ("none", "int8", "binary"):
+            raise ValueError(f"Unknown quantization {quantization!r}")
+        os.makedirs(path, exist_ok=True)
+        self.dim = dim
+        self.quantization = quantization
+        self.db_path = os.path.join(path, "rows.sqlite3")
+        self.matrix_path = os.path.join(path, "vectors.f32")
+        self.code_paths = {
+            "int8": os.path.join(path, "vectors.i8"),
+            "scales": os.path.join(path, "scales.f32"),
+            "bits": os.path.join(path, "vectors.bits"),
+        }
+        self.centroids_path = os.path.join(path, "centroids.npy")
+        # lock guards the published snapshot and sync bookkeeping, write_lock
+        # serializes loading, training and compaction within the process
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.state = _Snapshot()
+        self.synced_at = 0.0
+        self.syncing = False
+
+    def _create_tables(self, conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS rows (
+                position INTEGER PRIMARY KEY,
+                id INTEGER UNIQUE,
+                doc_id INTEGER,
+                chunk_no INTEGER,
+                body TEXT,
+                list_no INTEGER NOT NULL DEFAULT -1,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS rows_doc ON rows (doc_id, chunk_no)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+    def _connect(self):
+        return local_db.connect(self.db_path, self._create_tables)
+
+    def _check_dim(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row is None:
+            conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (self.dim,))
+        elif row[0] != self.dim:
+            raise ValueError(
+                f"Vector index holds {row[0]}-dim vectors but {self.dim} are "
+                f"configured, run: python vector_index.py migrate {self.dim}"
+            )
+
+    def _version(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, conn):
+        # Any write that changes what a search may return bumps the version,
+        # other processes pick it up on their next refresh
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    def _code_widths(self):
+        return {"int8": self.dim, "scales": 1, "bits": (self.dim + 7) // 8}
+
+    def _code_dtypes(self):
+        return {"int8": np.int8, "scales": np.float32, "bits": np.uint8}
+
+    def _files(self):
+        widths, dtypes = self._code_widths(), self._code_dtypes()
+        return [(self.matrix_path, np.float32, self.dim)] + [
+            (path, dtypes[name], widths[name]) for name, path in self.code_paths.items()
+        ]
+
+    def _build_codes(self, count):
+        # Indexes written before quantization existed only have vectors.f32
+        matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        tmp_paths = {name: path + ".tmp" for name, path in self.code_paths.items()}
+        files = {name: open(path, "wb") for name, path in tmp_paths.items()}
+        try:
+            for start in range(0, count, BLOCK_ROWS):
+                for name, codes in encode(np.asarray(matrix[start : start + BLOCK_ROWS])).items():
+                    files[name].write(codes.tobytes())
+        finally:
+            for f in files.values():
+                f.close()
+        for name, path in tmp_paths.items():
+            os.replace(path, self.code_paths[name])
+
+    def _refresh(self):
+        with self._connect() as conn:
+            version = self._version(conn)
+        centroids_mtime = (
+            os.path.getmtime(self.centroids_path)
+            if os.path.exists(self.centroids_path)
+            else None
+        )
+        with self.lock:
+            state = self.state
+        if state.version == version and state.centroids_mtime == centroids_mtime:
+            return state
+
+        with self.write_lock:
+            state = self._load()
+        with self.lock:
+            self.state = state
+        return state
+
+    def _load(self):
+        # Rows and centroids may have been written by another process (e.g.
+        # the ingestion pipeline), so the mapping is rebuilt from disk
+        with self._connect() as conn:
+            self._check_dim(conn)
+            version = self._version(conn)
+            rows = np.array(
+                conn.execute("SELECT list_no, deleted FROM rows ORDER BY position").fetchall(),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+        centroids_mtime = (
+            os.path.getmtime(self.centroids_path)
+            if os.path.exists(self.centroids_path)
+            else None
+        )
+        assignments, deleted = rows[:, 0], rows[:, 1].astype(bool)
+        count = len(rows)
+        if not count:
+            return _Snapshot(version, centroids_mtime=centroids_mtime)
+
+        widths, dtypes = self._code_widths(), self._code_dtypes()
+        if any(
+            not os.path.exists(path)
+            or os.path.getsize(path) < count * widths[name] * np.dtype(dtypes[name]).itemsize
+            for name, path in self.code_paths.items()
+        ):
+            self._build_codes(count)
+
+        centroids = np.load(self.centroids_path) if centroids_mtime else None
+        nlist = 0 if centroids is None else len(centroids)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(-1, nlist + 1))
+        return _Snapshot(
+            version=version,
+            count=count,
+            matrix=np.memmap(
+                self.matrix_path, dtype=np.float32, mode="r", shape=(count, self.dim)
+            ),
+            codes={
+                name: np.memmap(path, dtype=dtypes[name], mode="r", shape=(count, widths[name]))
+                for name, path in self.code_paths.items()
+            },
+            centroids=centroids,
+            centroids_mtime=centroids_mtime,
+            lists=[order[bounds[i] : bounds[i + 1]] for i in range(1, nlist + 1)],
+            unassigned=order[bounds[0] : bounds[1]],
+            deleted=deleted,
+        )
+
+    def add(self, rows):
+        if not rows:
+            return
+        # Full size rows from the vectors table are truncated Matryoshka style
+        vectors = reduce([row["embedding"] for row in rows], self.dim)
+        codes = encode(vectors)
+        widths, dtypes = self._code_widths(), self._code_dtypes()
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._check_dim(conn)
+            start = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            centroids = (
+                np.load(self.centroids_path)
+                if os.path.exists(self.centroids_path)
+                else None
+            )
+            list_nos = (
+                np.argmax(vectors @ centroids.T, axis=1)
+                if centroids is not None
+                else np.full(len(rows), -1)
+            )
+
+            # Drop any tail left by a writer that crashed before committing
+            with open(self.matrix_path, "ab") as f:
+                f.truncate(start * self.dim * 4)
+                f.write(vectors.tobytes())
+            for name, path in self.code_paths.items():
+                with open(path, "ab") as f:
+                    itemsize = np.dtype(dtypes[name]).itemsize
+                    f.truncate(start * widths[name] * itemsize)
+                    f.write(codes[name].tobytes())
+
+            conn.executemany(
+                "INSERT INTO rows (position, id, doc_id, chunk_no, body, list_no) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        start + i,
+                        row.get("id"),
+                        row.get("doc_id"),
+                        row.get("chunk_no"),
+                        row.get("body"),
+                        int(list_no),
+                    )
+                    for i, (row, list_no) in enumerate(zip(rows, list_nos))
+                ],
+            )
+            self._bump(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def remove(self, doc_id, chunk_nos=None):
+        with self._connect() as conn:
+            if chunk_nos is None:
+                conn.execute("UPDATE rows SET deleted = 1 WHERE doc_id = ?", (doc_id,))
+            else:
+                conn.executemany(
+                    "UPDATE rows SET deleted = 1 WHERE doc_id = ? AND chunk_no = ?",
+                    [(doc_id, chunk_no) for chunk_no in chunk_nos],
+                )
+            self._bump(conn)
+
+    def compact(self):
+        # Drops tombstoned rows so re-indexed documents don't pile up copies.
+        # The files are swapped right before the commit, a crash in between
+        # needs a rebuild (delete the directory and sync again)
+        self._refresh()
+        conn = self._connect()
+        with self.write_lock:
+            tmp_paths = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                self._check_dim(conn)
+                count = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+                live = np.array(
+                    conn.execute(
+                        "SELECT position FROM rows WHERE deleted = 0 ORDER BY position"
+                    ).fetchall(),
+                    dtype=np.int64,
+                ).reshape(-1)
+                if len(live) == count:
+                    conn.rollback()
+                    return 0
+
+                for path, dtype, width in self._files():
+                    source = np.memmap(path, dtype=dtype, mode="r", shape=(count, width))
+                    tmp_paths.append((path + ".tmp", path))
+                    with open(path + ".tmp", "wb") as f:
+                        for start in range(0, len(live), BLOCK_ROWS):
+                            f.write(np.asarray(source[live[start : start + BLOCK_ROWS]]).tobytes())
+                    del source
+
+                conn.execute("DELETE FROM rows WHERE deleted = 1")
+                # Ascending order never collides, a row only moves down into
+                # a slot that is free by then
+                conn.executemany(
+                    "UPDATE rows SET position = ? WHERE position = ?",
+                    [(i, int(position)) for i, position in enumerate(live)],
+                )
+                self._bump(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted', ?)",
+                    (self._version(conn),),
+                )
+                for tmp_path, path in tmp_paths:
+                    os.replace(tmp_path, path)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                for tmp_path, _ in tmp_paths:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                raise
+        return count - len(live)
+
+    def train(self, nlist=None, iterations=10, sample=50000, seed=0):
+        state = self._refresh()
+        live = np.flatnonzero(~state.deleted)
+        if not len(live):
+            return
+        nlist = nlist or max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(seed)
+        sample_rows = rng.choice(live, min(sample, len(live)), replace=False)
+        data = np.asarray(state.matrix[np.sort(sample_rows)])
+
+        # Spherical k-means, the embeddings are unit length
+        centroids = data[rng.choice(len(data), min(nlist, len(data)), replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[labels == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        list_nos = np.empty(state.count, dtype=np.int64)
+        for start in range(0, state.count, BLOCK_ROWS):
+            block = np.asarray(state.matrix[start : start + BLOCK_ROWS])
+            list_nos[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        with self.write_lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE rows SET list_no = ? WHERE position = ?",
+                [(int(list_no), position) for position, list_no in enumerate(list_nos)],
+            )
+            self._bump(conn)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.centroids_path), suffix=".npy"
+            )
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, centroids.astype(np.float32))
+            os.replace(tmp_path, self.centroids_path)
+
+    def search(self, query, k=10, threshold=None, exact=False, nprobe=NPROBE):
+        q = reduce(query, self.dim)
+        # Compaction renumbers positions, a search that raced with one is
+        # answered again from the new snapshot
+        while True:
+            results = self._search(self._refresh(), q, k, threshold, exact, nprobe)
+            if results is not None:
+                return results
+
+    def _search(self, state, q, k, threshold, exact, nprobe):
+        if not state.count:
+            return []
+
+        if exact or state.centroids is None:
+            positions = np.arange(state.count)
+        else:
+            probes = np.argsort(state.centroids @ q)[::-1][:nprobe]
+            positions = np.sort(
+                np.concatenate([state.unassigned] + [state.lists[p] for p in probes])
+            )
+        # Tombstones are dropped before ranking, otherwise stale copies of a
+        # re-indexed document take the best slots
+        positions = positions[~state.deleted[positions]]
+        if not len(positions):
+            return []
+
+        if not exact and self.quantization != "none":
+            coarse = self._coarse_scores(state, positions, q)
+            shortlist = min(len(positions), k * RESCORE_FACTOR[self.quantization])
+            if shortlist < len(positions):
+                best = np.argpartition(-coarse, shortlist - 1)[:shortlist]
+                positions = np.sort(positions[best])
+
+        # Fancy indexing copies, a full scan reads the memmap directly
+        full = len(positions) == state.count
+        scores = np.asarray((state.matrix if full else state.matrix[positions]) @ q)
+
+        take = min(len(positions), k * 2)
+        best = np.argpartition(-scores, take - 1)[:take]
+        candidates = {int(positions[i]): float(scores[i]) for i in best}
+
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            rows = conn.execute(
+                f"SELECT position, id, doc_id, chunk_no, body FROM rows "
+                f"WHERE deleted = 0 AND position IN ({','.join('?' * len(candidates))})",
+                list(candidates),
+            ).fetchall()
+            version = self._version(conn)
+            compacted = conn.execute(
+                "SELECT value FROM meta WHERE key = 'compacted'"
+            ).fetchone()
+        if compacted and compacted[0] > state.version:
+            return None
+        # Rows deleted after the snapshot was taken may leave too few
+        if len(rows) < min(k, take) and version != state.version:
+            return None
+
+        results = [
+            {
+                "id": id,
+                "doc_id": doc_id,
+                "chunk_no": chunk_no,
+                "body": body,
+                "similarity": candidates[position],
+            }
+            for position, id, doc_id, chunk_no, body in rows
+            if threshold is None or candidates[position] >= threshold
+        ]
+        results.sort(key=lambda row: row["similarity"], reverse=True)
+        return results[:k]
+
+    def _coarse_scores(self, state, positions, q):
+        scores = np.empty(len(positions), dtype=np.float32)
+        if self.quantization == "binary":
+            q_bits = np.packbits(q > 0)
+        full = len(positions) == state.count
+        step = INT8_BLOCK_ROWS if self.quantization == "int8" else BLOCK_ROWS
+        for start in range(0, len(positions), step):
+            block = slice(start, start + step) if full else positions[start : start + step]
+            if self.quantization == "int8":
+                codes = state.codes["int8"][block].astype(np.float32)
+                block_scores = (codes @ q) * state.codes["scales"][block, 0]
+            else:
+                # Fewer differing sign bits means a smaller angle
+                distance = _popcount(state.codes["bits"][block] ^ q_bits).sum(axis=1)
+                block_scores = -distance.astype(np.float32)
+            scores[start : start + len(block_scores)] = block_scores
+        return scores
+
+    def memory_bytes(self):
+        # What a query has to scan, i.e. what should stay in the page cache
+        widths = self._code_widths()
+        if self.quantization == "int8":
+            per_row = widths["int8"] + 4 * widths["scales"]
+        elif self.quantization == "binary":
+            per_row = widths["bits"]
+        else:
+            per_row = 4 * self.dim
+        return self.state.count * per_row
+
+    def migrate(self, dim):
+        # Truncates and renormalizes the stored vectors, no re-embedding needed
+        with self.write_lock:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                count = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            stored_dim = row[0] if row else FULL_DIMENSIONS
+            if count:
+                matrix = np.memmap(
+                    self.matrix_path, dtype=np.float32, mode="r", shape=(count, stored_dim)
+                )
+                tmp_path = self.matrix_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    for start in range(0, count, BLOCK_ROWS):
+                        f.write(reduce(matrix[start : start + BLOCK_ROWS], dim).tobytes())
+                del matrix
+                os.replace(tmp_path, self.matrix_path)
+            if os.path.exists(self.centroids_path):
+                os.unlink(self.centroids_path)
+
+            self.dim = dim
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (dim,))
+                conn.execute("UPDATE rows SET list_no = -1")
+                self._bump(conn)
+            if count:
+                self._build_codes(count)
+            with self.lock:
+                self.state = _Snapshot()
+        if count >= MIN_TRAIN_ROWS:
+            self.train()
+
+    def _remote_ids(self, supabase, after=0, until=None):
+        ids = []
+        while True:
+            query = supabase.table("vectors").select("id").gt("id", after)
+            if until is not None:
+                query = query.lte("id", until)
+            rows = query.order("id").limit(SYNC_PAGE_SIZE).execute().data
+            if not rows:
+                return ids
+            ids.extend(row["id"] for row in rows)
+            after = rows[-1]["id"]
+
+    def _add_ids(self, supabase, ids):
+        for start in range(0, len(ids), SYNC_FETCH_IDS):
+            rows = (
+                supabase.table("vectors")
+                .select("id, doc_id, chunk_no, body, embedding")
+                .in_("id", ids[start : start + SYNC_FETCH_IDS])
+                .order("id")
+                .execute()
+                .data
+            )
+            for row in rows:
+                if isinstance(row["embedding"], str):
+                    row["embedding"] = json.loads(row["embedding"])
+            self.add(rows)
+        return len(ids)
+
+    def _reconcile(self, supabase):
+        # Picks up rows committed below the rescan window and tombstones rows
+        # deleted upstream. Only runs when the live counts disagree
+        remote = supabase.table("vectors").select("id", count="exact").limit(1).execute().count
+        with self._connect() as conn:
+            live = conn.execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()[0]
+        if remote is None or remote == live:
+            return 0, 0
+
+        remote_ids = set(self._remote_ids(supabase))
+        with self._connect() as conn:
+            local = {row[0] for row in conn.execute("SELECT id FROM rows WHERE deleted = 0")}
+            known = {row[0] for row in conn.execute("SELECT id FROM rows")}
+        stale = sorted(local - remote_ids)
+        if stale:
+            with self._connect() as conn:
+                conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ?", [(i,) for i in stale])
+                self._bump(conn)
+        return self._add_ids(supabase, sorted(remote_ids - known)), len(stale)
+
+    def sync(self, supabase):
+        with self._connect() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM rows").fetchone()[0]
+            since = max(0, last_id - SYNC_RESCAN_IDS)
+            known = {
+                row[0] for row in conn.execute("SELECT id FROM rows WHERE id > ?", (since,))
+            }
+            trained = conn.execute(
+                "SELECT COUNT(*) FROM rows WHERE list_no >= 0"
+            ).fetchone()[0]
+
+        gaps = [i for i in self._remote_ids(supabase, since, last_id) if i not in known]
+        added = self._add_ids(supabase, gaps)
+        while True:
+            rows = (
+                supabase.table("vectors")
+                .select("id, doc_id, chunk_no, body, embedding")
+                .gt("id", last_id)
+                .order("id")
+                .limit(SYNC_PAGE_SIZE)
+                .execute()
+                .data
+            )
+            if not rows:
+                break
+            for row in rows:
+                if isinstance(row["embedding"], str):
+                    row["embedding"] = json.loads(row["embedding"])
+            self.add(rows)
+            added += len(rows)
+            last_id = rows[-1]["id"]
+
+        reconciled, removed = self._reconcile(supabase)
+        added += reconciled
+
+        state = self._refresh()
+        if state.count and state.deleted.sum() > COMPACT_RATIO * state.count:
+            self.compact()
+            state = self._refresh()
+
+        # Retrain once the index has doubled since the last training
+        if state.count >= MIN_TRAIN_ROWS and state.count >= 2 * trained:
+            self.train()
+
+        self.synced_at = time.time()
+        return added, removed
+
+    def sync_in_background(self, supabase):
+        with self.lock:
+            if self.syncing or time.time() - self.synced_at < VECTOR_INDEX_SYNC_SECONDS:
+                return
+            self.syncing = True
+
+        def run():
+            try:
+                self.sync(supabase)
+            except Exception as e:
+                print(f"Vector index sync failed: {e}")
+            finally:
+                with self.lock:
+                    self.syncing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex()
+        return _index
+
+
+def _synthetic(size, dim, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clustered synthetic embeddings, closer to real text than uniform noise
+    centers = rng.normal(size=(max(8, size // 500), dim)).astype(np.float32)
+    data = centers[rng.integers(len(centers), size=size)] + 0.5 * rng.normal(
+        size=(size, dim)
+    ).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    probes = data[rng.choice(size, queries, replace=False)] + 0.1 * rng.normal(
+        size=(queries, dim)
+    ).astype(np.float32)
+    return data, probes
+
+
+def _build(path, data, dim, quantization="none"):
+    index = VectorIndex(path, dim, quantization)
+    for start in range(0, len(data), 10000):
+        index.add(
+            [
+                {"id": start + i + 1, "embedding": vector}
+                for i, vector in enumerate(data[start : start + 10000])
+            ]
+        )
+    return index
+
+
+def _benchmark(size, dim, queries=100, k=10, seed=0):
+    data, probes = _synthetic(size, dim, queries, seed)
+
+    with tempfile.TemporaryDirectory() as path:
+        index = _build(path, data, dim)
+        index.train()
+
+        timings = {"exact": [], "ivf": []}
+        recall = []
+        for q in probes:
+            start = time.perf_counter()
+            exact = index.search(q, k, exact=True)
+            timings["exact"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            approx = index.search(q, k)
+            timings["ivf"].append(time.perf_counter() - start)
+            truth = {row["id"] for row in exact}
+            recall.append(len(truth & {row["id"] for row in approx}) / k)
+
+    for mode, samples in timings.items():
+        p50, p99 = np.percentile(samples, [50, 99]) * 1000
+        print(f"n={size} {mode:5} p50={p50:.2f}ms p99={p99:.2f}ms")
+    print(f"n={size} ivf recall@{k}={np.mean(recall):.3f}")
+
+
+def _benchmark_quantization(data, probes, dims=(FULL_DIMENSIONS, 512, 256), k=10):
+    # Recall is measured against an exact full precision, full size scan, so
+    # it includes what both the dimension cut and the quantization cost. Only
+    # the corpus run says anything about reduced dimensions, synthetic vectors
+    # have no Matryoshka structure
+    truth = [set(np.argsort(data @ q)[::-1][:k] + 1) for q in probes]
+
+    for dim in [d for d in dims if d <= data.shape[1]]:
+        with tempfile.TemporaryDirectory() as path:
+            index = _build(path, data, dim)
+            for quantization in ("none", "int8", "binary"):
+                index.quantization = quantization
+                timings, recall = [], []
+                for q, relevant in zip(probes, truth):
+                    start = time.perf_counter()
+                    found = index.search(q, k)
+                    timings.append(time.perf_counter() - start)
+                    recall.append(len(relevant & {row["id"] for row in found}) / k)
+
+                p50, p99 = np.percentile(timings, [50, 99]) * 1000
+                print(
+                    f"n={len(data)} dim={dim:4} {quantization:6} "
+                    f"scan={index.memory_bytes() / 2**20:7.1f}MB "
+                    f"p50={p50:.2f}ms p99={p99:.2f}ms recall@{k}={np.mean(recall):.3f}"
+                )
+
+
+def _corpus_sample(size=50000, queries=100, seed=0):
+    # Held out chunks of the synced corpus serve as queries
+    state = get_index()._refresh()
+    live = np.flatnonzero(~state.deleted)
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(live, min(len(live), size + queries), replace=False)
+    vectors = np.asarray(state.matrix[np.sort(picked)])
+    rng.shuffle(vectors)
+    return vectors[queries:], vectors[:queries]
+
+
+if __name__ == "__main__":
+    # Usage: python vector_index.py [size ...] | corpus | compact | migrate <dim>
+    if sys.argv[1:2] == ["compact"]:
+        print(f"Dropped {get_index().compact()} deleted rows")
+    elif sys.argv[1:2] == ["migrate"]:
+        dim = int(sys.argv[2])
+        VectorIndex(dim=dim).migrate(dim)
+        print(f"Local index migrated to {dim} dimensions, for the vectors table run:")
+        print(MIGRATION_SQL.format(dim=dim))
+    elif sys.argv[1:2] == ["corpus"]:
+        _benchmark_quantization(*_corpus_sample())
+    else:
+        for size in [int(arg) for arg in sys.argv[1:]] or [10000, 50000]:
+            _benchmark(size, EMBEDDING_DIMENSIONS)
+            _benchmark_quantization(*_synthetic(size, FULL_DIMENSIONS, 100))
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import embedding_cache
+import lexical_index
+from tokens import count_tokens
+from embedding_cache import EMBEDDING_MODEL
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+VECTOR_SEARCH = os.environ.get("VECTOR_SEARCH", "rpc")
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+CHUNK_SEPARATORS = ["\n\n", "\n", "."]
+EMBEDDING_BATCH_SIZE = 512
+EMBEDDING_BATCH_TOKENS = 250000
+INSERT_BATCH_SIZE = 500
+# PostgREST's default max-rows, a longer select is cut off silently
+SELECT_PAGE_SIZE = 1000
+MAX_RETRIES = 5
+# Natural key of a chunk, vectors needs a unique constraint on these columns
+# so a retried write can't duplicate rows
+CHUNK_CONFLICT_COLUMNS = "doc_id,chunk_no"
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    length_function=len,
+    is_separator_regex=False,
+    separators=CHUNK_SEPARATORS,
+)
+
+
+def split_text(text):
+    return text_splitter.split_text(text)
+
+
+def embed_texts(client, texts, model=EMBEDDING_MODEL):
+    return embedding_cache.embed(client, texts, model)
+
+
+def with_retries(fn, *args, retries=MAX_RETRIES):
+    for attempt in range(retries):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            delay = 2**attempt
+            print(f"Retrying in {delay}s after error: {e}")
+            time.sleep(delay)
+
+
+def embedding_batches(texts):
+    # Keep each request under the API's input count and token limits
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (
+            len(batch) == EMBEDDING_BATCH_SIZE
+            or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS
+        ):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embed_in_batches(client, texts, model=EMBEDDING_MODEL):
+    embeddings = []
+    for batch in embedding_batches(texts):
+        embeddings.extend(with_retries(embed_texts, client, batch, model))
+    return embeddings
+
+
+def get_document_id(supabase, pdf_url):
+    result = (
+        supabase.table("documents").select("id").eq("pdf_url", pdf_url).limit(1).execute()
+    )
+    return result.data[0]["id"] if result.data else None
+
+
+def get_chunks(supabase, doc_id):
+    chunks = []
+    while True:
+        rows = (
+            supabase.table("vectors")
+            .select("chunk_no, body, embedding")
+            .eq("doc_id", doc_id)
+            .order("chunk_no")
+            .range(len(chunks), len(chunks) + SELECT_PAGE_SIZE - 1)
+            .execute()
+            .data
+        )
+        for row in rows:
+            # pgvector columns come back from PostgREST as a "[...]" string
+            if isinstance(row["embedding"], str):
+                row["embedding"] = json.loads(row["embedding"])
+        chunks.extend(rows)
+        if len(rows) < SELECT_PAGE_SIZE:
+            return chunks
+
+
+def insert_rows(supabase, rows, retries=MAX_RETRIES):
+    # Returns the rows that could not be written, each with its error. An
+    # upsert, so a request that timed out after it was applied can be sent
+    # again without duplicating rows
+    write = supabase.table("vectors").upsert(rows, on_conflict=CHUNK_CONFLICT_COLUMNS)
+    try:
+        with_retries(write.execute, retries=retries)
+        return []
+    except Exception as e:
+        if len(rows) == 1:
+            return [(rows[0], e)]
+        # Split the batch so a single bad row doesn't fail its neighbours.
+        # The full batch already had its backoff, the halves get one try
+        # each until the bad row is isolated
+        middle = len(rows) // 2
+        return insert_rows(supabase, rows[:middle], retries=1) + insert_rows(
+            supabase, rows[middle:], retries=1
+        )
+
+
+def insert_chunks(supabase, doc_id, chunks, embeddings, chunk_nos=None):
+    chunk_nos = chunk_nos or range(1, len(chunks) + 1)
+    rows = [
+        {"doc_id": doc_id, "chunk_no": chunk_no, "body": chunk, "embedding": embedding}
+        for chunk_no, chunk, embedding in zip(chunk_nos, chunks, embeddings)
+    ]
+    failed = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        failed.extend(insert_rows(supabase, rows[start : start + INSERT_BATCH_SIZE]))
+
+    failed_nos = {row["chunk_no"] for row, _ in failed}
+    lexical_index.add_chunks([row for row in rows if row["chunk_no"] not in failed_nos])
+    if failed:
+        raise ValueError(
+            f"{len(failed)} of {len(rows)} chunks of document {doc_id} were not stored "
+            f"(chunk_no {sorted(failed_nos)}), first error: {failed[0][1]}"
+        )
+    return rows
+
+
+def delete_chunks(supabase, doc_id, chunk_nos=None):
+    query = supabase.table("vectors").delete().eq("doc_id", doc_id)
+    if chunk_nos is not None:
+        if not chunk_nos:
+            return
+        query = query.in_("chunk_no", list(chunk_nos))
+    with_retries(query.execute)
+    lexical_index.remove_chunks(doc_id, chunk_nos)
+
+
+def top_k(query_embedding, rows, k):
+    # OpenAI embeddings are unit length, so the dot product is the cosine.
+    # Rows stored before a switch to fewer dimensions are longer than the
+    # query, their prefix is renormalized to compare like with like
+    dim = len(query_embedding)
+    scored = []
+    for row in rows:
+        prefix = row["embedding"][:dim]
+        norm = sum(x * x for x in prefix) ** 0.5 or 1.0
+        score = sum(a * b for a, b in zip(query_embedding, prefix)) / norm
+        scored.append((score, row))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [row for _, row in scored[:k]]